@@ -0,0 +1,37 @@
+"""partial indexes on active rows
+
+Revision ID: 5c8e2f0d9b41
+Revises: a31fd0c025cb
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "5c8e2f0d9b41"
+down_revision: Union[str, None] = "a31fd0c025cb"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("artists", "albums", "tracks", "user_tracks", "users")
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.create_index(
+            f"ix_{table}_active",
+            table,
+            ["id"],
+            unique=False,
+            sqlite_where=sa.text("is_active = 1"),
+            postgresql_where=sa.text("is_active = true"),
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f"ix_{table}_active", table_name=table)
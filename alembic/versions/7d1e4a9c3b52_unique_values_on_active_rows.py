@@ -0,0 +1,100 @@
+"""unique values on active rows
+
+Revision ID: 7d1e4a9c3b52
+Revises: 5c8e2f0d9b41
+Create Date: 2026-10-20 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "7d1e4a9c3b52"
+down_revision: Union[str, None] = "5c8e2f0d9b41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNIQUE = {"artists": ("name",), "users": ("username", "phone_number")}
+
+
+def _table(name: str, *columns: sa.Column) -> sa.Table:
+    """The table as it should be after the upgrade, minus its indexes."""
+    return sa.Table(
+        name,
+        sa.MetaData(),
+        sa.Column("id", sa.Integer, primary_key=True),
+        *columns,
+        sa.Column("updated_at", sa.DateTime),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column("is_active", sa.Boolean),
+    )
+
+
+TABLES = {
+    "artists": _table("artists", sa.Column("name", sa.String, nullable=False)),
+    "users": _table(
+        "users",
+        sa.Column("username", sa.String(50), nullable=False),
+        sa.Column("phone_number", sa.String(15)),
+        sa.Column("password", sa.String(255), nullable=False),
+    ),
+}
+
+
+def _active_indexes(table: str):
+    op.create_index(f"ix_{table}_id", table, ["id"], unique=True)
+    op.create_index(
+        f"ix_{table}_active",
+        table,
+        ["id"],
+        sqlite_where=sa.text("is_active = 1"),
+        postgresql_where=sa.text("is_active = true"),
+    )
+
+
+def upgrade() -> None:
+    sqlite = op.get_bind().dialect.name == "sqlite"
+    for table, columns in UNIQUE.items():
+        if sqlite:
+            # SQLite can't drop the unnamed UNIQUE constraints, so the table is
+            # rebuilt without them (dropping its indexes too)
+            with op.batch_alter_table(
+                table, copy_from=TABLES[table], recreate="always"
+            ):
+                pass
+            _active_indexes(table)
+        else:
+            for column in columns:
+                op.drop_constraint(f"{table}_{column}_key", table, type_="unique")
+
+        for column in columns:
+            op.create_index(
+                f"uq_{table}_{column}_active",
+                table,
+                [column],
+                unique=True,
+                sqlite_where=sa.text("is_active = 1"),
+                postgresql_where=sa.text("is_active = true"),
+            )
+
+    op.create_index("ix_tracks_album_id", "tracks", ["album_id"])
+    op.create_index("ix_user_tracks_track_id", "user_tracks", ["track_id"])
+    op.create_index(
+        "ix_user_tracks_user_id_track_id", "user_tracks", ["user_id", "track_id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_tracks_user_id_track_id", table_name="user_tracks")
+    op.drop_index("ix_user_tracks_track_id", table_name="user_tracks")
+    op.drop_index("ix_tracks_album_id", table_name="tracks")
+
+    for table, columns in UNIQUE.items():
+        for column in columns:
+            op.drop_index(f"uq_{table}_{column}_active", table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            for column in columns:
+                batch_op.create_unique_constraint(f"{table}_{column}_key", [column])
@@ -0,0 +1,25 @@
+"""user_tracks by updated_at
+
+Revision ID: a6c4e9b2d350
+Revises: e8b3d5a0f172
+Create Date: 2026-10-21 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a6c4e9b2d350"
+down_revision: Union[str, None] = "e8b3d5a0f172"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_user_tracks_updated_at", "user_tracks", ["updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_tracks_updated_at", table_name="user_tracks")
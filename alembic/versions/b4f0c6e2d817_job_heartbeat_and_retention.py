@@ -0,0 +1,39 @@
+"""job heartbeat and retention
+
+Revision ID: b4f0c6e2d817
+Revises: 7d1e4a9c3b52
+Create Date: 2026-10-20 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b4f0c6e2d817"
+down_revision: Union[str, None] = "7d1e4a9c3b52"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_jobs() -> bool:
+    # The jobs table is created by ``create_all``; fresh databases get both
+    # columns and indexes from the model
+    return "jobs" in sa.inspect(op.get_bind()).get_table_names()
+
+
+def upgrade() -> None:
+    if not _has_jobs():
+        return
+    op.add_column("jobs", sa.Column("heartbeat_at", sa.DateTime(), nullable=True))
+    op.create_index("ix_jobs_finished_at", "jobs", ["finished_at"])
+
+
+def downgrade() -> None:
+    if not _has_jobs():
+        return
+    op.drop_index("ix_jobs_finished_at", table_name="jobs")
+    with op.batch_alter_table("jobs") as batch_op:
+        batch_op.drop_column("heartbeat_at")
@@ -0,0 +1,27 @@
+"""track_artist by artist
+
+Revision ID: d2a7f3c1e945
+Revises: b4f0c6e2d817
+Create Date: 2026-10-21 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d2a7f3c1e945"
+down_revision: Union[str, None] = "b4f0c6e2d817"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_track_artist_artist_id", "track_artist", ["artist_id", "track_id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_track_artist_artist_id", table_name="track_artist")
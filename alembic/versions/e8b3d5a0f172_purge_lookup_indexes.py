@@ -0,0 +1,53 @@
+"""purge lookup indexes
+
+Revision ID: e8b3d5a0f172
+Revises: d2a7f3c1e945
+Create Date: 2026-10-21 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e8b3d5a0f172"
+down_revision: Union[str, None] = "d2a7f3c1e945"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("artists", "albums", "tracks", "user_tracks", "users")
+# (table, column); these tables are created by ``create_all``, fresh databases
+# get the indexes from the models
+PERIOD_INDEXES = (
+    ("user_artist_period_stats", "artist_id"),
+    ("user_album_period_stats", "album_id"),
+)
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.create_index(
+            f"ix_{table}_inactive",
+            table,
+            ["id"],
+            unique=False,
+            sqlite_where=sa.text("is_active = 0"),
+            postgresql_where=sa.text("is_active = false"),
+        )
+
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    for table, column in PERIOD_INDEXES:
+        if table in existing:
+            op.create_index(f"ix_{table}_{column}", table, [column])
+
+
+def downgrade() -> None:
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    for table, column in PERIOD_INDEXES:
+        if table in existing:
+            op.drop_index(f"ix_{table}_{column}", table_name=table)
+
+    for table in TABLES:
+        op.drop_index(f"ix_{table}_inactive", table_name=table)
@@ -0,0 +1,108 @@
+"""CPU cost vs. bytes saved for the response encoders.
+
+Usage: python -m benchmarks.compression [number_of_tracks]
+
+The payload mimics a ``/tracks/`` response: repetitive JSON with nested
+albums and artists. Each encoder is run whole-body and in the chunked
+(streaming, flushed per chunk of 500 rows) mode the middleware uses for
+NDJSON.
+"""
+
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from trek.compression import BrotliEncoder, GzipEncoder, ZstdEncoder, brotli, zstandard
+
+LEVELS = {
+    "gzip": (GzipEncoder, (1, 3, 6, 9)),
+    "br": (BrotliEncoder, (1, 4, 6, 11)) if brotli else None,
+    "zstd": (ZstdEncoder, (1, 3, 9, 19)) if zstandard else None,
+}
+# Rows per chunk, ``ndjson_response``'s default ``batch_size``
+NDJSON_BATCH_SIZE = 500
+
+
+def make_tracks(count: int) -> list[dict]:
+    random.seed(0)
+    now = datetime(2024, 11, 5)
+    artists = [
+        {
+            "id": random.randint(10000000, 99999999),
+            "name": f"Artist {i}",
+            "created_at": (now - timedelta(days=i)).isoformat(),
+            "updated_at": now.isoformat(),
+            "is_active": True,
+        }
+        for i in range(200)
+    ]
+    albums = [
+        {
+            "id": random.randint(10000000, 99999999),
+            "name": f"Album {i}",
+            "release_year": 1990 + i % 35,
+            "created_at": (now - timedelta(days=i)).isoformat(),
+            "updated_at": now.isoformat(),
+            "is_active": True,
+        }
+        for i in range(100)
+    ]
+    return [
+        {
+            "id": random.randint(10000000, 99999999),
+            "name": f"Track {i}",
+            "duration": random.randint(90, 420),
+            "file_path": f"media/tracks/{i}/audio.mp3",
+            "thumbnail_path": f"media/tracks/{i}/thumbnails/cover.jpg",
+            "album": random.choice(albums),
+            "artists": random.sample(artists, random.randint(1, 3)),
+            "created_at": (now - timedelta(minutes=i)).isoformat(),
+            "updated_at": now.isoformat(),
+            "is_active": True,
+        }
+        for i in range(count)
+    ]
+
+
+def run(encoder_class, level: int, chunks: list[bytes]) -> tuple[int, float]:
+    start = time.perf_counter()
+    encoder = encoder_class(level)
+    size = 0
+    for index, chunk in enumerate(chunks):
+        size += len(encoder.compress(chunk, final=index == len(chunks) - 1))
+    return size, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tracks = make_tracks(count)
+    body = json.dumps(tracks).encode()
+    # NDJSON stream, grouped the way ndjson_response sends rows (one chunk per
+    # batch of rows)
+    lines = [json.dumps(track).encode() + b"\n" for track in tracks]
+    batches = [
+        b"".join(lines[start : start + NDJSON_BATCH_SIZE])
+        for start in range(0, len(lines), NDJSON_BATCH_SIZE)
+    ]
+
+    print(f"{count} tracks, {len(body) / 1024:.0f} KiB of JSON")
+    print(f"{'coding':<6} {'level':>5} {'mode':<8} {'ratio':>6} {'MB/s':>8} {'ms':>8}")
+    for coding, entry in LEVELS.items():
+        if entry is None:
+            print(f"{coding:<6} (not installed)")
+            continue
+        encoder_class, levels = entry
+        for level in levels:
+            for mode, chunks in (("whole", [body]), ("chunked", batches)):
+                size, elapsed = run(encoder_class, level, chunks)
+                print(
+                    f"{coding:<6} {level:>5} {mode:<8} "
+                    f"{len(body) / size:>6.1f} "
+                    f"{len(body) / elapsed / 1e6:>8.1f} {elapsed * 1000:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Database round trips and latency of ``POST /listen/`` with the entity cache.
+
+Usage: python -m benchmarks.entity_cache [number_of_listens]
+
+Runs against a throwaway SQLite database. Every statement sent to the database
+is counted, once with the entity cache disabled and once with it enabled.
+"""
+
+import random
+import sys
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from trek.cache import entity_cache
+from trek.database import Base, get_db
+from trek.settings import get_settings
+
+settings = get_settings()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    # Limiters read their budgets when main builds the routes; every request
+    # comes from the test client's address, so lift the per-IP budget too
+    settings.RATE_LIMITS["listen"] = (1e9, 1e9)
+    settings.RATE_LIMITS["listen_ip"] = (1e9, 1e9)
+
+    from main import app
+    from core.models import Album, Artist, Track
+    from users.models import User
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.sqlite3")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        statements = 0
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count_statement(*args):
+            nonlocal statements
+            statements += 1
+
+        def get_bench_db():
+            db = Session()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = get_bench_db
+
+        db = Session()
+        album = Album(name="Album", release_year=2024)
+        artists = [Artist(name=f"Artist {i}") for i in range(20)]
+        db.add_all([album, *artists])
+        db.commit()
+        tracks = []
+        for i in range(200):
+            track = Track(
+                name=f"Track {i}", duration=180, file_path="x", album_id=album.id
+            )
+            track.artists.append(artists[i % len(artists)])
+            tracks.append(track)
+        users = [User(username=f"user{i}", password="-") for i in range(50)]
+        db.add_all([*tracks, *users])
+        db.commit()
+        track_ids = [track.id for track in tracks]
+        user_ids = [user.id for user in users]
+        db.close()
+
+        client = TestClient(app)
+        random.seed(0)
+        listens = [
+            {"user_id": random.choice(user_ids), "track_id": random.choice(track_ids)}
+            for _ in range(count)
+        ]
+
+        print(f"{count} listens, {len(track_ids)} tracks, {len(user_ids)} users")
+        print(f"{'entity cache':<13} {'queries/listen':>15} {'ms/listen':>10}")
+        max_entries = entity_cache.max_entries
+        for label, enabled in (("off", 0), ("on", max_entries)):
+            entity_cache.max_entries = enabled
+            statements = 0
+            start = time.perf_counter()
+            for listen in listens:
+                response = client.post("/listen/", json=listen)
+                if response.status_code != 201:
+                    raise SystemExit(
+                        f"POST /listen/ returned {response.status_code}: "
+                        f"{response.text}"
+                    )
+            elapsed = time.perf_counter() - start
+            print(
+                f"{label:<13} {statements / count:>15.2f} "
+                f"{elapsed / count * 1000:>10.2f}"
+            )
+
+        entity_cache.max_entries = max_entries
+        app.dependency_overrides.clear()
+        print(entity_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Latency and payload size of track listings per response shape.
+
+Usage: python -m benchmarks.fieldsets [number_of_tracks]
+
+Runs against a throwaway SQLite database and times loading and serializing
+the whole listing (the work a cache miss on ``/tracks/`` does), comparing the
+ORM + ``TrackResponseSchema`` path with the per-shape serializers.
+"""
+
+import json
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from trek.database import Base
+
+SHAPES = (
+    (None, None),
+    ("id,name,thumbnail_path", None),
+    ("id,name,thumbnail_path", "artists"),
+    ("id,name,duration", "album"),
+)
+
+
+def best_of(func, repeat: int = 5) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    import users.models  # noqa: F401 -- registers every model with the mapper
+    from core.fieldsets import load_tracks, parse_track_shape
+    from core.models import Album, Artist, Track
+    from core.schemas import TrackResponseSchema
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.sqlite3")
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+
+        random.seed(0)
+        artists = [Artist(name=f"Artist {i}") for i in range(200)]
+        albums = [Album(name=f"Album {i}", release_year=2000) for i in range(100)]
+        db.add_all([*artists, *albums])
+        db.commit()
+        for i in range(count):
+            track = Track(
+                name=f"Track {i}",
+                duration=random.randint(90, 420),
+                file_path=f"media/tracks/{i}/audio.mp3",
+                thumbnail_path=f"media/tracks/{i}/thumbnails/cover.jpg",
+                album_id=random.choice(albums).id,
+            )
+            track.artists.extend(random.sample(artists, random.randint(1, 3)))
+            db.add(track)
+        db.commit()
+
+        def orm_listing():
+            db.expunge_all()
+            tracks = (
+                Track.active(db)
+                .options(selectinload(Track.artists), selectinload(Track.album))
+                .all()
+            )
+            return [
+                TrackResponseSchema.model_validate(
+                    track, from_attributes=True
+                ).model_dump(mode="json")
+                for track in tracks
+            ]
+
+        elapsed, body = best_of(orm_listing)
+        baseline = len(json.dumps(body))
+        print(f"{count} tracks")
+        print(f"{'shape':<48} {'ms':>8} {'KiB':>8} {'size':>6}")
+        print(
+            f"{'ORM + TrackResponseSchema':<48} {elapsed * 1000:>8.1f} "
+            f"{baseline / 1024:>8.0f} {1:>6.2f}"
+        )
+
+        for fields, include in SHAPES:
+            shape = parse_track_shape(fields, include)
+            elapsed, body = best_of(lambda: load_tracks(db, shape))
+            size = len(json.dumps(body))
+            label = f"fields={fields or '*'} include={include or '-'}"
+            if fields is None and include is None:
+                label = "full shape"
+            print(
+                f"{label:<48} {elapsed * 1000:>8.1f} "
+                f"{size / 1024:>8.0f} {size / baseline:>6.2f}"
+            )
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
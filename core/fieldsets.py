@@ -0,0 +1,153 @@
+"""Sparse fieldsets for track listings.
+
+``?fields=name,thumbnail_path`` narrows the track columns that are selected
+and returned (``id`` is always included) and ``?include=album,artists`` picks
+the related objects to embed. Without either parameter the full
+``TrackResponseSchema`` shape is returned. Rows are selected as plain columns,
+the album only joined and the artists only loaded when included, and each
+shape gets its serializer built once and cached.
+"""
+
+from functools import lru_cache
+from typing import Callable, NamedTuple
+
+from sqlalchemy import DateTime, and_, select, true
+from sqlalchemy.orm import Session
+
+from .models import Album, Artist, Track, track_artist
+from .schemas import AlbumResponseSchema, ArtistResponseSchema, TrackResponseSchema
+
+TRACK_INCLUDES = ("album", "artists")
+TRACK_FIELDS = tuple(
+    name for name in TrackResponseSchema.model_fields if name not in TRACK_INCLUDES
+)
+ALBUM_FIELDS = tuple(AlbumResponseSchema.model_fields)
+ARTIST_FIELDS = tuple(ArtistResponseSchema.model_fields)
+# Track ids bound per artist query, below SQLite's host parameter limit
+ID_CHUNK = 900
+
+
+class TrackShape(NamedTuple):
+    fields: tuple[str, ...]
+    include: tuple[str, ...]
+
+    @property
+    def key(self) -> str:
+        return f"{','.join(self.fields)}|{','.join(self.include)}"
+
+
+FULL_SHAPE = TrackShape(TRACK_FIELDS, TRACK_INCLUDES)
+
+
+def _split(value: str | None, allowed: tuple[str, ...], kind: str) -> set[str]:
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise ValueError(
+            f"Unknown {kind}: {', '.join(sorted(unknown))}. "
+            f"Available: {', '.join(allowed)}"
+        )
+    return names
+
+
+def parse_track_shape(fields: str | None, include: str | None) -> TrackShape:
+    """Validate the query parameters; names are put in canonical order."""
+    if not fields and include is None:
+        return FULL_SHAPE
+
+    field_names = _split(fields, TRACK_FIELDS, "fields") if fields else TRACK_FIELDS
+    field_names = {"id", *field_names}
+    include_names = _split(include, TRACK_INCLUDES, "includes") if include else ()
+    return TrackShape(
+        tuple(name for name in TRACK_FIELDS if name in field_names),
+        tuple(name for name in TRACK_INCLUDES if name in include_names),
+    )
+
+
+def track_query(shape: TrackShape):
+    """SELECT of just the shape's columns over active tracks."""
+    columns = [getattr(Track, name) for name in shape.fields]
+    query = select(*columns).where(Track.is_active == true())
+    if "album" in shape.include:
+        query = query.add_columns(
+            *(getattr(Album, name) for name in ALBUM_FIELDS)
+        ).outerjoin(Album, and_(Album.id == Track.album_id, Album.is_active == true()))
+    return query
+
+
+def _row_converter(columns) -> Callable[[tuple], list]:
+    """Turn a slice of row values into JSON-ready values."""
+    datetime_indices = [
+        index
+        for index, column in enumerate(columns)
+        if isinstance(column.type, DateTime)
+    ]
+
+    def convert(values) -> list:
+        values = list(values)
+        for index in datetime_indices:
+            if values[index] is not None:
+                values[index] = values[index].isoformat()
+        return values
+
+    return convert
+
+
+@lru_cache(maxsize=64)
+def compile_serializer(shape: TrackShape) -> Callable[[tuple, dict], dict]:
+    """Build the ``(row, artists by track id) -> dict`` function for a shape."""
+    field_count = len(shape.fields)
+    convert_track = _row_converter([getattr(Track, name) for name in shape.fields])
+    with_album = "album" in shape.include
+    with_artists = "artists" in shape.include
+    convert_album = _row_converter([getattr(Album, name) for name in ALBUM_FIELDS])
+    id_index = shape.fields.index("id")
+
+    def serialize(row, artists: dict) -> dict:
+        item = dict(zip(shape.fields, convert_track(row[:field_count])))
+        if with_album:
+            album = row[field_count:]
+            item["album"] = (
+                dict(zip(ALBUM_FIELDS, convert_album(album)))
+                if album[0] is not None
+                else None
+            )
+        if with_artists:
+            item["artists"] = artists.get(row[id_index], [])
+        return item
+
+    return serialize
+
+
+def _load_artists(db: Session, track_ids: list[int]) -> dict[int, list[dict]]:
+    """Serialized artists of a batch of tracks, one query per ``ID_CHUNK`` ids."""
+    columns = [getattr(Artist, name) for name in ARTIST_FIELDS]
+    convert = _row_converter(columns)
+    query = (
+        select(track_artist.c.track_id, *columns)
+        .join(Artist, Artist.id == track_artist.c.artist_id)
+        .where(Artist.is_active == true())
+    )
+    artists: dict[int, list[dict]] = {}
+    for start in range(0, len(track_ids), ID_CHUNK):
+        chunk = track_ids[start : start + ID_CHUNK]
+        for track_id, *values in db.execute(
+            query.where(track_artist.c.track_id.in_(chunk))
+        ):
+            artists.setdefault(track_id, []).append(
+                dict(zip(ARTIST_FIELDS, convert(values)))
+            )
+    return artists
+
+
+def serialize_rows(db: Session, shape: TrackShape, rows) -> list[dict]:
+    serialize = compile_serializer(shape)
+    artists = {}
+    if "artists" in shape.include and rows:
+        id_index = shape.fields.index("id")
+        artists = _load_artists(db, [row[id_index] for row in rows])
+    return [serialize(row, artists) for row in rows]
+
+
+def load_tracks(db: Session, shape: TrackShape, *where) -> list[dict]:
+    return serialize_rows(db, shape, db.execute(track_query(shape).where(*where)).all())
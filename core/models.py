@@ -7,11 +7,16 @@ from sqlalchemy import (
     ForeignKey,
     Table,
     func,
+    Date,
     DateTime,
     Boolean,
+    Index,
+    text,
+    true,
 )
-from sqlalchemy.orm import relationship, Session
+from sqlalchemy.orm import relationship, Session, declared_attr
 
+from trek.cache import cache, entity_cache
 from trek.database import Base
 from users.utils import get_number_id
 
@@ -22,6 +27,38 @@ class BaseModel(Base):
     created_at = Column(DateTime, default=datetime.now)
     is_active = Column(Boolean, default=True)
 
+    # Fields ``get_cached`` may look rows up by (the primary key and unique
+    # columns); models without any are not kept in the entity cache
+    cache_fields: tuple[str, ...] = ()
+    # Columns unique among active rows only, so a soft-deleted row doesn't
+    # hold on to its value until it is purged
+    unique_when_active: tuple[str, ...] = ()
+
+    @declared_attr
+    def __table_args__(cls):
+        # Partial indexes over live rows, and over soft-deleted rows for the
+        # purge; queries must compare is_active to a literal (``== true()``,
+        # ``== false()``) for the planner to match them
+        active = {
+            "sqlite_where": text("is_active = 1"),
+            "postgresql_where": text("is_active = true"),
+        }
+        table = cls.__tablename__
+        indexes = [
+            Index(f"ix_{table}_active", "id", **active),
+            Index(
+                f"ix_{table}_inactive",
+                "id",
+                sqlite_where=text("is_active = 0"),
+                postgresql_where=text("is_active = false"),
+            ),
+        ]
+        for column in cls.unique_when_active:
+            indexes.append(
+                Index(f"uq_{table}_{column}_active", column, unique=True, **active)
+            )
+        return tuple(indexes)
+
     def save(self, db: Session):
         """Save the model instance to the database."""
         try:
@@ -30,30 +67,44 @@ class BaseModel(Base):
         except Exception as e:
             db.rollback()
             raise e  # Consider logging the error here
+        # Cached snapshots of the row itself are dropped by the commit hooks
+        # in trek.cache
+        cache.invalidate(self.__tablename__)
 
     def delete(self, db: Session):
-        """Delete the model instance from the database."""
-        try:
-            db.delete(self)
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            raise e  # Consider logging the error here
+        """Soft-delete the model instance.
+
+        Dependent rows and the instance itself are removed later in small
+        batches by ``core.purge``.
+        """
+        self.is_active = False
+        self.save(db)
+
+    @classmethod
+    def active(cls, db: Session):
+        """Query over active (not soft-deleted) model instances."""
+        return db.query(cls).filter(cls.is_active == true())
 
     @classmethod
     def get(cls, db: Session, **kwargs):
         """Get a single model instance based on provided filters."""
-        return db.query(cls).filter_by(**kwargs).first()
+        return cls.active(db).filter_by(**kwargs).first()
+
+    @classmethod
+    def get_cached(cls, db: Session, **kwargs):
+        """Like ``get`` by a single cached field, but returns a read-only
+        snapshot served from the entity cache when it is still current."""
+        return entity_cache.get(db, cls, **kwargs)
 
     @classmethod
     def filter(cls, db: Session, **kwargs):
         """Filter model instances based on provided filters."""
-        return db.query(cls).filter_by(**kwargs).all()
+        return cls.active(db).filter_by(**kwargs).all()
 
     @classmethod
     def all(cls, db: Session):
         """Get all model instances."""
-        return db.query(cls).all()
+        return cls.active(db).all()
 
 
 track_artist = Table(
@@ -61,23 +112,33 @@ track_artist = Table(
     Base.metadata,
     Column("track_id", Integer, ForeignKey("tracks.id"), primary_key=True),
     Column("artist_id", Integer, ForeignKey("artists.id"), primary_key=True),
+    # The primary key only serves lookups by track; this one serves by artist
+    Index("ix_track_artist_artist_id", "artist_id", "track_id"),
 )
 
 
 class Artist(BaseModel):
     __tablename__ = "artists"
+    cache_fields = ("id", "name")
+    unique_when_active = ("name",)
 
     id = Column(
         Integer, primary_key=True, index=True, default=get_number_id, unique=True
     )
-    name = Column(String, unique=True, nullable=False)
+    name = Column(String, nullable=False)
 
     # Many-to-many relationship with Track
-    tracks = relationship("Track", secondary=track_artist, back_populates="artists")
+    tracks = relationship(
+        "Track",
+        secondary=track_artist,
+        secondaryjoin="and_(Track.id == track_artist.c.track_id, Track.is_active)",
+        back_populates="artists",
+    )
 
 
 class Album(BaseModel):
     __tablename__ = "albums"
+    cache_fields = ("id",)
 
     id = Column(
         Integer, primary_key=True, index=True, default=get_number_id, unique=True
@@ -86,11 +147,16 @@ class Album(BaseModel):
     release_year = Column(Integer)
 
     # One-to-many relationship with Track
-    tracks = relationship("Track", back_populates="album")
+    tracks = relationship(
+        "Track",
+        primaryjoin="and_(Album.id == Track.album_id, Track.is_active)",
+        back_populates="album",
+    )
 
 
 class Track(BaseModel):
     __tablename__ = "tracks"
+    cache_fields = ("id",)
 
     id = Column(
         Integer, primary_key=True, index=True, default=get_number_id, unique=True
@@ -101,25 +167,68 @@ class Track(BaseModel):
     thumbnail_path = Column(String, nullable=True)  # Store thumbnail path or URL
 
     # Foreign key to Album
-    album_id = Column(Integer, ForeignKey("albums.id"), nullable=True)
+    album_id = Column(Integer, ForeignKey("albums.id"), nullable=True, index=True)
 
     # Many-to-many relationship with Artist
-    artists = relationship("Artist", secondary=track_artist, back_populates="tracks")
+    artists = relationship(
+        "Artist",
+        secondary=track_artist,
+        secondaryjoin="and_(Artist.id == track_artist.c.artist_id, Artist.is_active)",
+        back_populates="tracks",
+    )
 
     # Relationship with Album
-    album = relationship("Album", back_populates="tracks")
+    album = relationship(
+        "Album",
+        primaryjoin="and_(Album.id == Track.album_id, Album.is_active)",
+        back_populates="tracks",
+    )
 
     users = relationship("UserTrack", back_populates="track")
 
     def add_artists(self, db: Session, artist_ids: list[int]):
         """Add artists to this track."""
+        from .stats import track_linked
+
         for artist_id in artist_ids:
             artist = Artist.get(db, id=artist_id)  # Use the get method from BaseModel
             if artist:
                 self.artists.append(artist)  # Add artist to the track's artist list
+                track_linked(db, self.id, artist_id=artist_id)
+                # Relinks don't touch the tracks row otherwise, but the radio
+                # graph finds changed tracks by updated_at
+                self.updated_at = datetime.now()
             else:
                 raise ValueError(f"Artist with ID {artist_id} not found")
 
+    def set_artists(self, db: Session, artist_ids: list[int]):
+        """Replace this track's artists, moving its listens between them."""
+        from .stats import track_unlinked
+
+        current_ids = {artist.id for artist in self.artists}
+        for artist in list(self.artists):
+            if artist.id not in artist_ids:
+                self.artists.remove(artist)
+                track_unlinked(db, self.id, artist_id=artist.id)
+                self.updated_at = datetime.now()
+        self.add_artists(
+            db, [artist_id for artist_id in artist_ids if artist_id not in current_ids]
+        )
+
+    def set_album(self, db: Session, album_id: int | None):
+        """Move this track and its listens to another album."""
+        from .stats import track_linked, track_unlinked
+
+        if album_id == self.album_id:
+            return
+        if album_id is not None and not Album.get_cached(db, id=album_id):
+            raise ValueError(f"Album with ID {album_id} not found")
+        if self.album_id is not None:
+            track_unlinked(db, self.id, album_id=self.album_id)
+        if album_id is not None:
+            track_linked(db, self.id, album_id=album_id)
+        self.album_id = album_id
+
     @classmethod
     def get_most_listened_tracks(cls, db: Session, limit: int = 10):
         from users.models import UserTrack
@@ -128,6 +237,7 @@ class Track(BaseModel):
         return (
             db.query(cls, func.sum(UserTrack.listen_count).label("total_listens"))
             .join(UserTrack)
+            .filter(cls.is_active == true())
             .group_by(cls.id)
             .order_by(func.sum(UserTrack.listen_count).desc())
             .limit(limit)
@@ -143,9 +253,98 @@ class Track(BaseModel):
         return (
             db.query(cls, func.sum(UserTrack.listen_count).label("recent_listens"))
             .join(UserTrack)
-            .filter(UserTrack.last_listened >= recent_date)
+            .filter(UserTrack.last_listened >= recent_date, cls.is_active == true())
             .group_by(cls.id)
             .order_by(func.sum(UserTrack.listen_count).desc())
             .limit(limit)
             .all()
         )
+
+
+class TrackStats(Base):
+    __tablename__ = "track_stats"
+
+    track_id = Column(Integer, ForeignKey("tracks.id"), primary_key=True)
+    total_plays = Column(Integer, default=0, nullable=False, index=True)
+    listener_count = Column(Integer, default=0, nullable=False)
+
+
+class ArtistStats(Base):
+    __tablename__ = "artist_stats"
+
+    artist_id = Column(Integer, ForeignKey("artists.id"), primary_key=True)
+    total_plays = Column(Integer, default=0, nullable=False)
+    listener_count = Column(Integer, default=0, nullable=False)
+
+
+class ArtistListener(Base):
+    """Plays of an artist's tracks per user, so listener counts stay exact."""
+
+    __tablename__ = "artist_listeners"
+
+    artist_id = Column(Integer, ForeignKey("artists.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    plays = Column(Integer, default=0, nullable=False)
+
+
+class AlbumStats(Base):
+    __tablename__ = "album_stats"
+
+    album_id = Column(Integer, ForeignKey("albums.id"), primary_key=True)
+    total_plays = Column(Integer, default=0, nullable=False)
+    listener_count = Column(Integer, default=0, nullable=False)
+
+
+class AlbumListener(Base):
+    """Plays of an album's tracks per user, so listener counts stay exact."""
+
+    __tablename__ = "album_listeners"
+
+    album_id = Column(Integer, ForeignKey("albums.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    plays = Column(Integer, default=0, nullable=False)
+
+
+class UserPeriodStats(Base):
+    """A user's listening totals over one calendar week, month or year."""
+
+    __tablename__ = "user_period_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    period = Column(String(5), primary_key=True)  # week | month | year
+    period_start = Column(Date, primary_key=True)
+    plays = Column(Integer, default=0, nullable=False)
+    seconds = Column(Integer, default=0, nullable=False)
+
+
+class UserArtistPeriodStats(Base):
+    __tablename__ = "user_artist_period_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    period = Column(String(5), primary_key=True)
+    period_start = Column(Date, primary_key=True)
+    artist_id = Column(Integer, ForeignKey("artists.id"), primary_key=True, index=True)
+    plays = Column(Integer, default=0, nullable=False)
+    seconds = Column(Integer, default=0, nullable=False)
+
+
+class UserAlbumPeriodStats(Base):
+    __tablename__ = "user_album_period_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    period = Column(String(5), primary_key=True)
+    period_start = Column(Date, primary_key=True)
+    album_id = Column(Integer, ForeignKey("albums.id"), primary_key=True, index=True)
+    plays = Column(Integer, default=0, nullable=False)
+    seconds = Column(Integer, default=0, nullable=False)
+
+
+class Blob(Base):
+    """A content-addressed media file, shared by every track referencing it."""
+
+    __tablename__ = "blobs"
+
+    hash = Column(String(64), primary_key=True)  # sha256 hex digest
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0, index=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
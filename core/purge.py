@@ -0,0 +1,227 @@
+"""Physical removal of soft-deleted rows.
+
+``BaseModel.delete`` only flags a row inactive. This module removes the row and
+everything hanging off it (listens, artist links, stats, media references,
+waveform sidecars) one small batch per transaction, so deleting a popular track
+or artist never holds a long write lock. Deletes enqueue a ``purge_deleted``
+job (see ``core.tasks``); run ``python -m core.purge`` to purge everything
+pending at once.
+"""
+
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import delete, false, select, update
+from sqlalchemy.orm import Session
+
+from trek.cache import cache, entity_cache
+from trek.database import SessionLocal
+from trek.settings import get_settings
+from .models import (
+    Track,
+    Artist,
+    Album,
+    track_artist,
+    TrackStats,
+    ArtistStats,
+    ArtistListener,
+    AlbumStats,
+    AlbumListener,
+    UserArtistPeriodStats,
+    UserAlbumPeriodStats,
+)
+from .stats import USER_PERIOD_MODELS, withdraw_listens
+from .storage import release_reference
+from .waveform import waveform_path
+
+settings = get_settings()
+
+
+def _delete_chunk(db: Session, table, where, key, batch_size: int) -> int:
+    """Delete up to ``batch_size`` rows matching ``where``, chosen by ``key``."""
+    chunk = select(key).where(where).limit(batch_size)
+    return db.execute(delete(table).where(where, key.in_(chunk))).rowcount
+
+
+def _purge_listens(db: Session, where, batch_size: int) -> bool:
+    from users.models import UserTrack
+
+    # Deleting first claims the rows: a concurrent purge blocks on them and
+    # gets nothing back, so each listen is withdrawn exactly once
+    chunk = select(UserTrack.id).where(where).limit(batch_size)
+    listens = db.execute(
+        delete(UserTrack)
+        .where(UserTrack.id.in_(chunk))
+        .returning(UserTrack.user_id, UserTrack.track_id, UserTrack.listen_count)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not listens:
+        return False
+
+    withdraw_listens(db, listens)
+    return True
+
+
+def _purge_track(db: Session, batch_size: int) -> bool:
+    from users.models import UserTrack
+
+    track_id = db.scalar(select(Track.id).where(Track.is_active == false()).limit(1))
+    if track_id is None:
+        return False
+
+    if _purge_listens(db, UserTrack.track_id == track_id, batch_size):
+        return True
+
+    db.execute(delete(track_artist).where(track_artist.c.track_id == track_id))
+    db.execute(delete(TrackStats).where(TrackStats.track_id == track_id))
+    media = db.execute(
+        delete(Track)
+        .where(Track.id == track_id)
+        .returning(Track.file_path, Track.thumbnail_path)
+        .execution_options(synchronize_session=False)
+    ).first()
+    # Only the purge that removed the row releases its media
+    if media is not None:
+        for path in media:
+            release_reference(db, path)
+        waveform_path(track_id).unlink(missing_ok=True)
+    return True
+
+
+def _purge_artist(db: Session, batch_size: int) -> bool:
+    artist_id = db.scalar(select(Artist.id).where(Artist.is_active == false()).limit(1))
+    if artist_id is None:
+        return False
+
+    where = track_artist.c.artist_id == artist_id
+    chunk = select(track_artist.c.track_id).where(where).limit(batch_size)
+    track_ids = db.scalars(
+        delete(track_artist)
+        .where(where, track_artist.c.track_id.in_(chunk))
+        .returning(track_artist.c.track_id)
+    ).all()
+    if track_ids:
+        # Unlinking doesn't touch the tracks rows otherwise, but the radio
+        # graph finds changed tracks by updated_at
+        db.execute(
+            update(Track)
+            .where(Track.id.in_(track_ids))
+            .values(updated_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        entity_cache.mark_stale(db, Track, track_ids)
+        return True
+    for table, where, key in (
+        (
+            ArtistListener,
+            ArtistListener.artist_id == artist_id,
+            ArtistListener.user_id,
+        ),
+        (
+            UserArtistPeriodStats,
+            UserArtistPeriodStats.artist_id == artist_id,
+            UserArtistPeriodStats.user_id,
+        ),
+    ):
+        if _delete_chunk(db, table, where, key, batch_size):
+            return True
+
+    db.execute(delete(ArtistStats).where(ArtistStats.artist_id == artist_id))
+    db.execute(delete(Artist).where(Artist.id == artist_id))
+    return True
+
+
+def _purge_album(db: Session, batch_size: int) -> bool:
+    album_id = db.scalar(select(Album.id).where(Album.is_active == false()).limit(1))
+    if album_id is None:
+        return False
+
+    chunk = select(Track.id).where(Track.album_id == album_id).limit(batch_size)
+    track_ids = db.scalars(
+        update(Track)
+        .where(Track.id.in_(chunk))
+        .values(album_id=None, updated_at=datetime.now())
+        .returning(Track.id)
+    ).all()
+    if track_ids:
+        entity_cache.mark_stale(db, Track, track_ids)
+        return True
+    for table, where, key in (
+        (
+            AlbumListener,
+            AlbumListener.album_id == album_id,
+            AlbumListener.user_id,
+        ),
+        (
+            UserAlbumPeriodStats,
+            UserAlbumPeriodStats.album_id == album_id,
+            UserAlbumPeriodStats.user_id,
+        ),
+    ):
+        if _delete_chunk(db, table, where, key, batch_size):
+            return True
+
+    db.execute(delete(AlbumStats).where(AlbumStats.album_id == album_id))
+    db.execute(delete(Album).where(Album.id == album_id))
+    return True
+
+
+def _purge_user(db: Session, batch_size: int) -> bool:
+    from users.models import User, UserTrack
+
+    user_id = db.scalar(select(User.id).where(User.is_active == false()).limit(1))
+    if user_id is None:
+        return False
+
+    if _purge_listens(db, UserTrack.user_id == user_id, batch_size):
+        return True
+
+    for model in USER_PERIOD_MODELS:
+        db.execute(delete(model).where(model.user_id == user_id))
+    db.execute(delete(User).where(User.id == user_id))
+    return True
+
+
+PURGE_STEPS = (
+    ("tracks", _purge_track),
+    ("artists", _purge_artist),
+    ("albums", _purge_album),
+    ("users", _purge_user),
+)
+
+
+def purge_batch(db: Session, batch_size: int) -> bool:
+    """Purge one batch in its own transaction. Returns False once nothing is left."""
+    for table, step in PURGE_STEPS:
+        try:
+            purged = step(db, batch_size)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if purged:
+            cache.invalidate(table)
+            return True
+    return False
+
+
+async def purge_deleted():
+    """Purge all soft-deleted rows, yielding between batches."""
+    while True:
+        db = SessionLocal()
+        try:
+            # Run the blocking batch off the event loop
+            purged = await asyncio.to_thread(
+                purge_batch, db, settings.PURGE["BATCH_SIZE"]
+            )
+        finally:
+            db.close()
+        if not purged:
+            return
+        await asyncio.sleep(settings.PURGE["PAUSE"])
+
+
+if __name__ == "__main__":
+    import users.models  # noqa: F401 -- registers User and UserTrack
+
+    asyncio.run(purge_deleted())
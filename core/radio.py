@@ -0,0 +1,338 @@
+"""Radio mode: endless queues generated by random walks over the catalog.
+
+Tracks are linked through three bipartite relations: shared artists
+(track_artist), shared albums (tracks.album_id) and shared listeners
+(user_tracks). Each relation is held in memory as a pair of CSR arrays
+(track -> groups, group -> tracks), which avoids materialising the quadratic
+track-to-track edges of large artists or heavy listeners. A walk step picks a
+relation by weight, a random group of the current track, then a member of that
+group (weighted by listen count for listeners).
+
+The graph is refreshed incrementally: only tracks, ``user_tracks`` rows and
+soft-deleted artists, albums and users whose ``updated_at`` moved are read back
+from the database.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import and_, false, func, select, true
+from sqlalchemy.orm import Session
+
+from trek.database import SessionLocal
+from trek.settings import get_settings
+from .models import Album, Artist, Track, track_artist
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+EMPTY = np.empty(0, np.int32)
+
+
+def _pairs(track_ids: np.ndarray, user_ids: np.ndarray) -> np.ndarray:
+    """One int64 key per (track, user) listen edge."""
+    return (track_ids << 32) | user_ids
+
+
+def _indptr(sorted_rows: np.ndarray, size: int) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(np.bincount(sorted_rows, minlength=size))))
+
+
+class Relation:
+    """Track <-> group adjacency in CSR form."""
+
+    def __init__(
+        self,
+        nodes: np.ndarray,
+        groups: np.ndarray,
+        node_count: int,
+        weights: np.ndarray | None = None,
+    ):
+        self.group_ids, group_index = np.unique(groups, return_inverse=True)
+
+        order = np.argsort(nodes, kind="stable")
+        self.node_indptr = _indptr(nodes[order], node_count)
+        self.node_groups = group_index[order].astype(np.int32)
+
+        order = np.argsort(group_index, kind="stable")
+        self.group_indptr = _indptr(group_index[order], len(self.group_ids))
+        self.group_nodes = nodes[order].astype(np.int32)
+        # Running weight totals, so a weighted pick is one binary search
+        self.group_cumweights = (
+            np.cumsum(weights[order], dtype=np.float64) if weights is not None else None
+        )
+
+    def degree(self, node: int) -> int:
+        return int(self.node_indptr[node + 1] - self.node_indptr[node])
+
+    def members(self, group_id: int) -> np.ndarray:
+        index = np.searchsorted(self.group_ids, group_id)
+        if index == len(self.group_ids) or self.group_ids[index] != group_id:
+            return EMPTY
+        return self.group_nodes[self.group_indptr[index] : self.group_indptr[index + 1]]
+
+    def step(self, node: int, rng: np.random.Generator) -> int:
+        start, end = self.node_indptr[node], self.node_indptr[node + 1]
+        group = self.node_groups[rng.integers(start, end)]
+        start, end = self.group_indptr[group], self.group_indptr[group + 1]
+        if self.group_cumweights is None:
+            return int(self.group_nodes[rng.integers(start, end)])
+
+        base = self.group_cumweights[start - 1] if start else 0.0
+        target = base + rng.random() * (self.group_cumweights[end - 1] - base)
+        offset = np.searchsorted(self.group_cumweights[start:end], target, side="right")
+        return int(self.group_nodes[start + min(offset, end - start - 1)])
+
+
+class Snapshot:
+    """Immutable graph built from the raw edge lists at one point in time."""
+
+    def __init__(self, track_ids, album_ids, artist_edges, listen_edges):
+        self.track_ids = track_ids  # sorted; node index -> track id
+        node_count = len(track_ids)
+
+        has_album = album_ids >= 0
+        self.relations = {
+            "album": Relation(
+                np.flatnonzero(has_album), album_ids[has_album], node_count
+            ),
+            "artist": Relation(*self._map(*artist_edges), node_count),
+        }
+        nodes, users, counts = self._map(*listen_edges)
+        self.relations["listener"] = Relation(nodes, users, node_count, weights=counts)
+
+    def node(self, track_id: int) -> int | None:
+        index = np.searchsorted(self.track_ids, track_id)
+        if index < len(self.track_ids) and self.track_ids[index] == track_id:
+            return int(index)
+        return None
+
+    def _map(self, track_ids: np.ndarray, *columns: np.ndarray):
+        """Translate track ids to node indices, dropping inactive tracks."""
+        index = np.searchsorted(self.track_ids, track_ids)
+        index = np.minimum(index, max(len(self.track_ids) - 1, 0))
+        known = (
+            self.track_ids[index] == track_ids
+            if len(self.track_ids)
+            else np.zeros(len(track_ids), bool)
+        )
+        return (index[known],) + tuple(column[known] for column in columns)
+
+
+class RadioGraph:
+    def __init__(self):
+        self.snapshot: Snapshot | None = None
+        self.refreshed_at: datetime | None = None
+        self.refreshed_monotonic = 0.0
+        self.lock = threading.Lock()
+
+        # Raw edge lists, patched in place on every refresh
+        self.track_ids = np.empty(0, np.int64)
+        self.album_ids = np.empty(0, np.int64)  # -1 for no album
+        self.artist_edges = (np.empty(0, np.int64), np.empty(0, np.int64))
+        self.listen_edges = (
+            np.empty(0, np.int64),
+            np.empty(0, np.int64),
+            np.empty(0, np.float64),
+        )
+
+    def is_stale(self) -> bool:
+        interval = settings.RADIO["REFRESH_INTERVAL"]
+        return time.monotonic() - self.refreshed_monotonic > interval
+
+    def refresh(self, db: Session):
+        """Apply database changes since the last refresh and swap in a new snapshot."""
+        from users.models import User, UserTrack
+
+        with self.lock:
+            started_at = datetime.now()
+            since = None
+            if self.refreshed_at is not None:
+                # updated_at is set at flush time, so a row committed after the
+                # last refresh started may carry an earlier timestamp; re-read
+                # a margin before it (reapplying a row is harmless)
+                overlap = timedelta(seconds=settings.RADIO["REFRESH_OVERLAP"])
+                since = self.refreshed_at - overlap
+
+            def changed(query, model):
+                return (
+                    query if since is None else query.where(model.updated_at >= since)
+                )
+
+            def deleted(model) -> np.ndarray:
+                """Ids of rows soft-deleted since the last refresh."""
+                if since is None:
+                    return np.empty(0, np.int64)
+                query = select(model.id).where(model.is_active == false())
+                return np.array(db.scalars(changed(query, model)).all(), np.int64)
+
+            # Tracks on a soft-deleted album count as having no album
+            query = select(
+                Track.id,
+                func.coalesce(Album.id, -1),
+                func.coalesce(Track.is_active, false()),
+            ).outerjoin(
+                Album, and_(Album.id == Track.album_id, Album.is_active == true())
+            )
+            changed_tracks = np.array(
+                db.execute(changed(query, Track)).all(), dtype=np.int64
+            ).reshape(-1, 3)
+            changed_ids = changed_tracks[:, 0]
+            live = changed_tracks[changed_tracks[:, 2] == 1]
+            removed_ids = changed_tracks[changed_tracks[:, 2] != 1, 0]
+
+            keep = ~np.isin(self.track_ids, changed_ids)
+            track_ids = np.concatenate((self.track_ids[keep], live[:, 0]))
+            album_ids = np.concatenate((self.album_ids[keep], live[:, 1]))
+            album_ids[np.isin(album_ids, deleted(Album))] = -1
+            order = np.argsort(track_ids)
+            self.track_ids, self.album_ids = track_ids[order], album_ids[order]
+
+            artist_query = select(
+                track_artist.c.track_id, track_artist.c.artist_id
+            ).join(
+                Artist,
+                and_(Artist.id == track_artist.c.artist_id, Artist.is_active == true()),
+            )
+            if since is not None:
+                artist_query = artist_query.where(
+                    track_artist.c.track_id.in_(live[:, 0].tolist())
+                )
+            artist_rows = np.array(db.execute(artist_query).all(), np.int64)
+            artist_rows = artist_rows.reshape(-1, 2)
+            keep = ~np.isin(self.artist_edges[0], changed_ids) & ~np.isin(
+                self.artist_edges[1], deleted(Artist)
+            )
+            self.artist_edges = (
+                np.concatenate((self.artist_edges[0][keep], artist_rows[:, 0])),
+                np.concatenate((self.artist_edges[1][keep], artist_rows[:, 1])),
+            )
+
+            # Listens are replaced per (track, user), so new plays update the
+            # weight of an existing edge; purged rows belong to soft-deleted
+            # tracks or users and are dropped with them
+            listen_query = (
+                select(UserTrack.track_id, UserTrack.user_id, UserTrack.listen_count)
+                .join(
+                    Track,
+                    and_(Track.id == UserTrack.track_id, Track.is_active == true()),
+                )
+                .join(
+                    User, and_(User.id == UserTrack.user_id, User.is_active == true())
+                )
+            )
+            listen_rows = np.array(
+                db.execute(changed(listen_query, UserTrack)).all(), np.int64
+            ).reshape(-1, 3)
+            tracks, users, counts = self.listen_edges
+            keep = (
+                ~np.isin(
+                    _pairs(tracks, users), _pairs(listen_rows[:, 0], listen_rows[:, 1])
+                )
+                & ~np.isin(tracks, removed_ids)
+                & ~np.isin(users, deleted(User))
+            )
+            self.listen_edges = (
+                np.concatenate((tracks[keep], listen_rows[:, 0])),
+                np.concatenate((users[keep], listen_rows[:, 1])),
+                np.concatenate((counts[keep], listen_rows[:, 2])),
+            )
+
+            self.snapshot = Snapshot(
+                self.track_ids, self.album_ids, self.artist_edges, self.listen_edges
+            )
+            self.refreshed_at = started_at
+            self.refreshed_monotonic = time.monotonic()
+
+    def refresh_with_session(self):
+        db = SessionLocal()
+        try:
+            self.refresh(db)
+        finally:
+            db.close()
+
+    async def ensure_fresh(self):
+        """Build the graph on first use; afterwards refresh it in the background."""
+        if self.snapshot is None:
+            await asyncio.to_thread(self.refresh_with_session)
+        elif self.is_stale() and not self.lock.locked():
+            # Push the deadline so concurrent requests don't queue more refreshes
+            self.refreshed_monotonic = time.monotonic()
+            refresh = asyncio.get_running_loop().run_in_executor(
+                None, self.refresh_with_session
+            )
+            refresh.add_done_callback(self._log_refresh_failure)
+
+    @staticmethod
+    def _log_refresh_failure(refresh: asyncio.Future):
+        if not refresh.cancelled() and refresh.exception() is not None:
+            logger.error("Radio graph refresh failed", exc_info=refresh.exception())
+
+    def generate(
+        self,
+        track_id: int | None = None,
+        artist_id: int | None = None,
+        limit: int = 25,
+        exclude: set[int] = frozenset(),
+        rng: np.random.Generator | None = None,
+    ) -> list[int]:
+        """Walk from the seed and return up to ``limit`` unseen track ids."""
+        snapshot = self.snapshot
+        rng = rng or np.random.default_rng()
+
+        if track_id is not None:
+            node = snapshot.node(track_id)
+            seeds = np.array([node] if node is not None else [], np.int32)
+        else:
+            seeds = snapshot.relations["artist"].members(artist_id)
+        if not len(seeds):
+            return []
+
+        relations = [
+            (snapshot.relations[name], weight)
+            for name, weight in settings.RADIO["WEIGHTS"].items()
+        ]
+        restart = settings.RADIO["RESTART"]
+        seen = set(exclude)
+        if track_id is not None:
+            seen.add(track_id)
+
+        result = []
+        current = int(rng.choice(seeds))
+        for _ in range(limit * settings.RADIO["STEPS_PER_TRACK"]):
+            if rng.random() < restart:
+                current = int(rng.choice(seeds))
+
+            available = [(rel, w) for rel, w in relations if rel.degree(current)]
+            if not available:
+                current = int(rng.choice(seeds))
+                continue
+            weights = np.array([w for _, w in available])
+            relation = available[rng.choice(len(available), p=weights / weights.sum())][
+                0
+            ]
+            current = relation.step(current, rng)
+
+            candidate = int(snapshot.track_ids[current])
+            if candidate not in seen:
+                seen.add(candidate)
+                result.append(candidate)
+                if len(result) == limit:
+                    return result
+
+        # Sparse neighbourhood: top up with random tracks so the queue never ends
+        attempts = 0
+        while len(result) < limit and attempts < limit * 10:
+            attempts += 1
+            candidate = int(snapshot.track_ids[rng.integers(len(snapshot.track_ids))])
+            if candidate not in seen:
+                seen.add(candidate)
+                result.append(candidate)
+        return result
+
+
+radio_graph = RadioGraph()
@@ -67,3 +67,39 @@ class TrackResponseSchema(BaseModel):
     created_at: datetime
     updated_at: datetime
     is_active: bool
+
+
+class RadioResponseSchema(BaseModel):
+    tracks: list[TrackResponseSchema]
+
+
+class TopTrackSchema(BaseModel):
+    id: int
+    name: str
+    total_plays: int
+
+
+class ArtistStatsResponseSchema(BaseModel):
+    artist_id: int
+    total_plays: int
+    listener_count: int
+    top_tracks: list[TopTrackSchema]
+
+
+class AlbumStatsResponseSchema(BaseModel):
+    album_id: int
+    total_plays: int
+    listener_count: int
+    top_tracks: list[TopTrackSchema]
+
+
+class EntityCacheTableStatsSchema(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class EntityCacheStatsResponseSchema(BaseModel):
+    entries: int
+    max_entries: int
+    tables: dict[str, EntityCacheTableStatsSchema]
@@ -0,0 +1,548 @@
+"""Incrementally maintained play and listener statistics.
+
+Run ``python -m core.stats`` to rebuild every stats table from ``user_tracks``
+(or ``python -m core.stats --check`` to only report drift), and
+``python -m core.stats --users`` to backfill periods missing from the per-user
+period tables (``--users --force`` recomputes them all).
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import and_, delete, func, or_, select, true
+from sqlalchemy.orm import Session
+
+from trek.database import get_insert, lock_tables
+from .models import (
+    Track,
+    Artist,
+    Album,
+    track_artist,
+    TrackStats,
+    ArtistStats,
+    ArtistListener,
+    AlbumStats,
+    AlbumListener,
+    UserPeriodStats,
+    UserArtistPeriodStats,
+    UserAlbumPeriodStats,
+)
+
+# (stats model, per-user listener model, key column)
+ARTIST = (ArtistStats, ArtistListener, "artist_id")
+ALBUM = (AlbumStats, AlbumListener, "album_id")
+
+USER_PERIOD_MODELS = (UserPeriodStats, UserArtistPeriodStats, UserAlbumPeriodStats)
+
+
+def period_starts(day: date) -> dict[str, date]:
+    """First day of the calendar week (Monday), month and year of ``day``."""
+    return {
+        "week": day - timedelta(days=day.weekday()),
+        "month": day.replace(day=1),
+        "year": day.replace(month=1, day=1),
+    }
+
+
+def _bump(db: Session, model, key: dict, returning=None, **deltas):
+    """Add ``deltas`` to the row identified by ``key``, creating it if missing."""
+    insert = get_insert(db)
+    stmt = (
+        insert(model)
+        .values(**key, **deltas)
+        .on_conflict_do_update(
+            index_elements=list(key),
+            set_={name: getattr(model, name) + delta for name, delta in deltas.items()},
+        )
+    )
+    if returning is not None:
+        return db.execute(stmt.returning(returning)).scalar_one()
+    db.execute(stmt)
+
+
+def _bump_many(db: Session, model, rows: list[dict], *counters: str):
+    """Upsert ``rows`` in one statement, adding their ``counters`` to existing rows."""
+    if not rows:
+        return
+    insert = get_insert(db)
+    stmt = insert(model).values(rows)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[column.name for column in model.__table__.primary_key],
+            set_={
+                name: getattr(model, name) + getattr(stmt.excluded, name)
+                for name in counters
+            },
+        )
+    )
+
+
+def _add_plays(db: Session, group, group_id: int, user_plays):
+    """Add (or with negative counts, remove) users' plays to an artist or album."""
+    stats_model, listener_model, key = group
+    total_plays = 0
+    listeners = 0
+    for user_id, plays in user_plays:
+        if not plays:
+            continue
+        total_plays += plays
+        new_plays = _bump(
+            db,
+            listener_model,
+            {key: group_id, "user_id": user_id},
+            returning=listener_model.plays,
+            plays=plays,
+        )
+        if plays > 0 and new_plays == plays:
+            listeners += 1
+        elif new_plays <= 0:
+            db.execute(
+                delete(listener_model).where(
+                    getattr(listener_model, key) == group_id,
+                    listener_model.user_id == user_id,
+                )
+            )
+            listeners -= 1
+
+    if total_plays or listeners:
+        _bump(
+            db,
+            stats_model,
+            {key: group_id},
+            total_plays=total_plays,
+            listener_count=listeners,
+        )
+
+
+def _track_listens(db: Session, track_id: int, sign: int = 1):
+    from users.models import UserTrack
+
+    return [
+        (user_id, sign * listen_count)
+        for user_id, listen_count in db.execute(
+            select(UserTrack.user_id, UserTrack.listen_count).where(
+                UserTrack.track_id == track_id
+            )
+        )
+    ]
+
+
+def record_listen(db: Session, user_id: int, track_id: int, first_listen: bool):
+    """Count one listen. Runs in the caller's transaction, which must commit."""
+    _bump(
+        db,
+        TrackStats,
+        {"track_id": track_id},
+        total_plays=1,
+        listener_count=int(first_listen),
+    )
+
+    artist_ids = db.scalars(
+        select(track_artist.c.artist_id).where(track_artist.c.track_id == track_id)
+    ).all()
+    for artist_id in artist_ids:
+        _add_plays(db, ARTIST, artist_id, [(user_id, 1)])
+
+    track = Track.get_cached(db, id=track_id)
+    album_id = track.album_id if track is not None else None
+    if album_id is not None:
+        _add_plays(db, ALBUM, album_id, [(user_id, 1)])
+
+    # Per-user totals for the current week, month and year, one statement each
+    seconds = (track.duration if track is not None else None) or 0
+    totals, artists, albums = [], [], []
+    for period, start in period_starts(date.today()).items():
+        row = {
+            "user_id": user_id,
+            "period": period,
+            "period_start": start,
+            "plays": 1,
+            "seconds": seconds,
+        }
+        totals.append(row)
+        artists += [{**row, "artist_id": artist_id} for artist_id in artist_ids]
+        if album_id is not None:
+            albums.append({**row, "album_id": album_id})
+    for model, rows in zip(USER_PERIOD_MODELS, (totals, artists, albums)):
+        _bump_many(db, model, rows, "plays", "seconds")
+
+
+def track_linked(
+    db: Session,
+    track_id: int,
+    artist_id: int | None = None,
+    album_id: int | None = None,
+):
+    """Credit a track's existing listens to a newly linked artist or album."""
+    listens = _track_listens(db, track_id)
+    if artist_id is not None:
+        _add_plays(db, ARTIST, artist_id, listens)
+    if album_id is not None:
+        _add_plays(db, ALBUM, album_id, listens)
+
+
+def track_unlinked(
+    db: Session,
+    track_id: int,
+    artist_id: int | None = None,
+    album_id: int | None = None,
+):
+    """Withdraw a track's listens from an artist or album it no longer belongs to."""
+    listens = _track_listens(db, track_id, sign=-1)
+    if artist_id is not None:
+        _add_plays(db, ARTIST, artist_id, listens)
+    if album_id is not None:
+        _add_plays(db, ALBUM, album_id, listens)
+
+
+def withdraw_listens(db: Session, listens):
+    """Remove ``(user_id, track_id, listen_count)`` listens from every stats table.
+
+    Used before the underlying user_tracks rows are physically deleted.
+    """
+    track_groups = {}
+    for user_id, track_id, listen_count in listens:
+        if not listen_count:
+            continue
+        _bump(
+            db,
+            TrackStats,
+            {"track_id": track_id},
+            total_plays=-listen_count,
+            listener_count=-1,
+        )
+
+        if track_id not in track_groups:
+            track_groups[track_id] = (
+                db.scalars(
+                    select(track_artist.c.artist_id).where(
+                        track_artist.c.track_id == track_id
+                    )
+                ).all(),
+                db.scalar(select(Track.album_id).where(Track.id == track_id)),
+            )
+        artist_ids, album_id = track_groups[track_id]
+        for artist_id in artist_ids:
+            _add_plays(db, ARTIST, artist_id, [(user_id, -listen_count)])
+        if album_id is not None:
+            _add_plays(db, ALBUM, album_id, [(user_id, -listen_count)])
+
+
+def get_top_tracks(
+    db: Session, artist_id: int | None = None, album_id: int | None = None, limit=10
+):
+    query = (
+        db.query(Track.id, Track.name, TrackStats.total_plays)
+        .join(TrackStats, TrackStats.track_id == Track.id)
+        .filter(Track.is_active == true())
+        .order_by(TrackStats.total_plays.desc())
+    )
+    if artist_id is not None:
+        query = query.join(track_artist, track_artist.c.track_id == Track.id).filter(
+            track_artist.c.artist_id == artist_id
+        )
+    if album_id is not None:
+        query = query.filter(Track.album_id == album_id)
+
+    return [
+        {"id": id, "name": name, "total_plays": total_plays}
+        for id, name, total_plays in query.limit(limit).all()
+    ]
+
+
+def get_user_stats(db: Session, user_id: int, limit: int = 5) -> dict:
+    """A user's current week, month and year with top artists and albums.
+
+    Reads the period tables with three queries, whatever the history size.
+    """
+    starts = period_starts(date.today())
+
+    def current(model):
+        return and_(
+            model.user_id == user_id,
+            or_(
+                *(
+                    and_(model.period == period, model.period_start == start)
+                    for period, start in starts.items()
+                )
+            ),
+        )
+
+    result = {
+        period: {
+            "period_start": start,
+            "plays": 0,
+            "seconds": 0,
+            "top_artists": [],
+            "top_albums": [],
+        }
+        for period, start in starts.items()
+    }
+    for period, plays, seconds in db.execute(
+        select(
+            UserPeriodStats.period, UserPeriodStats.plays, UserPeriodStats.seconds
+        ).where(current(UserPeriodStats))
+    ):
+        result[period].update(plays=plays, seconds=seconds)
+
+    for model, group, key, field in (
+        (UserArtistPeriodStats, Artist, "artist_id", "top_artists"),
+        (UserAlbumPeriodStats, Album, "album_id", "top_albums"),
+    ):
+        rank = func.row_number().over(
+            partition_by=model.period,
+            order_by=(model.plays.desc(), model.seconds.desc()),
+        )
+        ranked = (
+            select(
+                model.period,
+                group.id,
+                group.name,
+                model.plays,
+                model.seconds,
+                rank.label("rank"),
+            )
+            .join(group, group.id == getattr(model, key))
+            .where(current(model), group.is_active == true())
+            .subquery()
+        )
+        for period, id, name, plays, seconds, _ in db.execute(
+            select(ranked)
+            .where(ranked.c.rank <= limit)
+            .order_by(ranked.c.period, ranked.c.rank)
+        ):
+            result[period][field].append(
+                {"id": id, "name": name, "plays": plays, "seconds": seconds}
+            )
+
+    return result
+
+
+def _period_rows(rows, key: str | None = None) -> list[dict]:
+    """Sum ``(user_id, listened_at, count, duration[, key])`` rows per period."""
+    totals = defaultdict(lambda: [0, 0])
+    for user_id, listened_at, count, duration, *group in rows:
+        if listened_at is None:
+            continue
+        for period, start in period_starts(listened_at.date()).items():
+            entry = totals[(user_id, period, start, *group)]
+            entry[0] += count
+            entry[1] += count * duration
+
+    names = ("user_id", "period", "period_start") + ((key,) if key else ())
+    return [
+        {**dict(zip(names, row_key)), "plays": plays, "seconds": seconds}
+        for row_key, (plays, seconds) in totals.items()
+    ]
+
+
+def rebuild_user_stats(db: Session, batch_size: int = 500, force: bool = False) -> int:
+    """Backfill the per-user period tables, one batch of users per transaction.
+
+    ``user_tracks`` only keeps a count and the last listen time per track, so
+    all of a track's listens are attributed to the periods of its last listen,
+    and listens of purged tracks are gone. The recompute is therefore only
+    written to periods a user has no rows for yet; incrementally maintained
+    rows are kept unless ``force`` replaces them all. Each batch holds the
+    write lock, so listens recorded meanwhile wait instead of being lost or
+    counted twice. Returns the number of users processed.
+    """
+    from users.models import User, UserTrack
+
+    listens = (
+        select(
+            UserTrack.user_id,
+            UserTrack.last_listened,
+            UserTrack.listen_count,
+            func.coalesce(Track.duration, 0),
+        )
+        .join(Track, Track.id == UserTrack.track_id)
+        .where(UserTrack.listen_count > 0)
+    )
+    insert = get_insert(db)
+
+    processed = 0
+    last_id = None
+    while True:
+        db.commit()
+        # Same order as listens write them
+        lock_tables(
+            db,
+            *(model.__table__ for model in USER_PERIOD_MODELS),
+            UserTrack.__table__,
+        )
+        try:
+            query = select(User.id).order_by(User.id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(User.id > last_id)
+            user_ids = db.scalars(query).all()
+            if not user_ids:
+                db.commit()
+                return processed
+
+            batch = listens.where(UserTrack.user_id.in_(user_ids))
+            rows = (
+                _period_rows(db.execute(batch)),
+                _period_rows(
+                    db.execute(
+                        batch.add_columns(track_artist.c.artist_id).join(
+                            track_artist, track_artist.c.track_id == Track.id
+                        )
+                    ),
+                    "artist_id",
+                ),
+                _period_rows(
+                    db.execute(
+                        batch.add_columns(Track.album_id).where(
+                            Track.album_id.isnot(None)
+                        )
+                    ),
+                    "album_id",
+                ),
+            )
+            if force:
+                for model in USER_PERIOD_MODELS:
+                    db.execute(delete(model).where(model.user_id.in_(user_ids)))
+            else:
+                # Periods are filled whole, so a period's artist and album rows
+                # never mix incremental and recomputed plays
+                filled = set(
+                    db.execute(
+                        select(
+                            UserPeriodStats.user_id,
+                            UserPeriodStats.period,
+                            UserPeriodStats.period_start,
+                        ).where(UserPeriodStats.user_id.in_(user_ids))
+                    ).all()
+                )
+                rows = tuple(
+                    [
+                        row
+                        for row in model_rows
+                        if (row["user_id"], row["period"], row["period_start"])
+                        not in filled
+                    ]
+                    for model_rows in rows
+                )
+            for model, model_rows in zip(USER_PERIOD_MODELS, rows):
+                if model_rows:
+                    db.execute(insert(model).on_conflict_do_nothing(), model_rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        processed += len(user_ids)
+        last_id = user_ids[-1]
+
+
+def _expected_stats(db: Session):
+    """Recompute every stats table from user_tracks with grouped queries."""
+    from users.models import UserTrack
+
+    plays = func.sum(UserTrack.listen_count)
+    expected = {
+        TrackStats: {
+            (track_id,): (total, listeners)
+            for track_id, total, listeners in db.execute(
+                select(UserTrack.track_id, plays, func.count())
+                .where(UserTrack.listen_count > 0)
+                .group_by(UserTrack.track_id)
+            )
+        }
+    }
+
+    groups = (
+        (
+            ARTIST,
+            track_artist.c.artist_id,
+            UserTrack.track_id == track_artist.c.track_id,
+        ),
+        (ALBUM, Track.album_id, UserTrack.track_id == Track.id),
+    )
+    for (stats_model, listener_model, key), column, onclause in groups:
+        listeners = {
+            (group_id, user_id): (total,)
+            for group_id, user_id, total in db.execute(
+                select(column, UserTrack.user_id, plays)
+                .select_from(UserTrack)
+                .join(column.table, onclause)
+                .where(UserTrack.listen_count > 0, column.isnot(None))
+                .group_by(column, UserTrack.user_id)
+            )
+        }
+        stats = {}
+        for (group_id, _), (total,) in listeners.items():
+            total_plays, listener_count = stats.get((group_id,), (0, 0))
+            stats[(group_id,)] = (total_plays + total, listener_count + 1)
+        expected[listener_model] = listeners
+        expected[stats_model] = stats
+
+    return expected
+
+
+def reconcile(db: Session, fix: bool = True) -> dict[str, int]:
+    """Compare stored stats with a full recompute and rebuild drifted tables.
+
+    With ``fix`` the recompute and the rebuild run in one transaction holding
+    the write lock, so listens recorded meanwhile wait instead of being lost.
+    Returns the number of drifted rows per table.
+    """
+    from users.models import UserTrack
+
+    if fix:
+        db.commit()
+        # Same order as record_listen writes them
+        lock_tables(
+            db,
+            TrackStats.__table__,
+            ArtistListener.__table__,
+            ArtistStats.__table__,
+            AlbumListener.__table__,
+            AlbumStats.__table__,
+            UserTrack.__table__,
+        )
+
+    drift = {}
+    for model, rows in _expected_stats(db).items():
+        columns = [column.name for column in model.__table__.columns]
+        key_length = len(model.__table__.primary_key.columns)
+        stored = {
+            tuple(row[:key_length]): tuple(row[key_length:])
+            for row in db.execute(select(*model.__table__.columns))
+            # Rows emptied by unlinking are equivalent to missing ones
+            if any(row[key_length:])
+        }
+        drift[model.__tablename__] = sum(
+            stored.get(key) != value for key, value in rows.items()
+        ) + sum(key not in rows for key in stored)
+
+        if fix and drift[model.__tablename__]:
+            db.execute(delete(model))
+            if rows:
+                db.execute(
+                    model.__table__.insert(),
+                    [dict(zip(columns, key + value)) for key, value in rows.items()],
+                )
+    if fix:
+        db.commit()
+    return drift
+
+
+if __name__ == "__main__":
+    import sys
+
+    import users.models  # noqa: F401 -- registers UserTrack with the mapper
+    from trek.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if "--users" in sys.argv:
+            count = rebuild_user_stats(db, force="--force" in sys.argv)
+            print(f"{count} users processed")
+        else:
+            result = reconcile(db, fix="--check" not in sys.argv)
+            for table, count in result.items():
+                print(f"{table}: {count} drifted rows")
+    finally:
+        db.close()
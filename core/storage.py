@@ -0,0 +1,261 @@
+"""Content-addressed media storage.
+
+Files live once under ``STORAGE["BLOB_ROOT"]/ab/cd/<sha256>``. ``Track.file_path``
+and ``Track.thumbnail_path`` hold the blob path relative to ``BASE_DIR``, and
+the ``blobs`` table counts how many of those references point at each file.
+Unreferenced blobs are removed by the ``collect_blobs`` job.
+
+    python -m core.storage gc        drop unreferenced blobs now
+    python -m core.storage migrate   move media/tracks files into the blob store
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fastapi import UploadFile
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from trek.database import get_insert
+from trek.settings import BASE_DIR, get_settings
+from .models import Blob, Track
+
+settings = get_settings()
+
+BLOB_ROOT = settings.STORAGE["BLOB_ROOT"]
+BLOB_PREFIX = BLOB_ROOT.relative_to(BASE_DIR).as_posix() + "/"
+
+
+def blob_path(digest: str) -> Path:
+    return BLOB_ROOT / digest[:2] / digest[2:4] / digest
+
+
+def blob_reference(digest: str) -> str:
+    return blob_path(digest).relative_to(BASE_DIR).as_posix()
+
+
+def reference_hash(reference: str | None) -> str | None:
+    """The blob hash a track path points at, or None for other paths and URLs."""
+    if reference and reference.startswith(BLOB_PREFIX):
+        return reference.rsplit("/", 1)[-1]
+    return None
+
+
+def _add_blob(db: Session, digest: str, size: int, source: Path):
+    """Reference a blob, moving ``source`` into place unless it's a duplicate.
+
+    The upsert takes the row lock first, so a concurrent garbage collection
+    either finishes removing the old file before we check for it, or sees a
+    non-zero ref_count and leaves it alone.
+    """
+    insert = get_insert(db)
+    db.execute(
+        insert(Blob)
+        .values(hash=digest, size=size, ref_count=1, updated_at=datetime.now())
+        .on_conflict_do_update(
+            index_elements=["hash"],
+            set_={"ref_count": Blob.ref_count + 1, "updated_at": datetime.now()},
+        )
+    )
+    path = blob_path(digest)
+    if path.exists():
+        source.unlink()
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, path)
+    db.commit()
+
+
+async def store_upload(db: Session, upload: UploadFile) -> str:
+    """Stream an upload into the blob store and return its reference.
+
+    The hash is computed while the body streams to a temporary file; identical
+    content already stored costs no extra space.
+    """
+    chunk_size = settings.STORAGE["CHUNK_SIZE"]
+    tmp_dir = BLOB_ROOT / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    hasher = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+        try:
+            while chunk := await upload.read(chunk_size):
+                hasher.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+
+    digest = hasher.hexdigest()
+    try:
+        _add_blob(db, digest, size, Path(tmp.name))
+    except BaseException:
+        db.rollback()
+        Path(tmp.name).unlink(missing_ok=True)
+        raise
+    return blob_reference(digest)
+
+
+def retain_reference(db: Session, reference: str | None):
+    """Count a new reference to an already stored blob (no-op for other paths)."""
+    digest = reference_hash(reference)
+    if digest is None:
+        return
+    if not db.execute(
+        update(Blob)
+        .where(Blob.hash == digest)
+        .values(ref_count=Blob.ref_count + 1, updated_at=datetime.now())
+    ).rowcount:
+        raise ValueError(f"Blob {digest} not found")
+
+
+def release_reference(db: Session, reference: str | None):
+    """Drop a reference; the blob itself is removed later by garbage collection."""
+    digest = reference_hash(reference)
+    if digest is None:
+        return
+    db.execute(
+        update(Blob)
+        .where(Blob.hash == digest, Blob.ref_count > 0)
+        .values(ref_count=Blob.ref_count - 1, updated_at=datetime.now())
+    )
+
+
+def replace_reference(db: Session, old: str | None, new: str | None):
+    if old != new:
+        retain_reference(db, new)
+        release_reference(db, old)
+
+
+def collect_garbage(db: Session, grace: int | None = None) -> int:
+    """Delete blobs unreferenced for longer than ``grace`` seconds.
+
+    Also removes stray files with no row at all, and temporary files left in
+    ``tmp/`` by interrupted uploads. Those get at least the configured grace
+    period, so ``gc`` with ``grace=0`` doesn't remove uploads still streaming.
+    """
+    grace = settings.STORAGE["GC_GRACE"] if grace is None else grace
+    cutoff = datetime.now() - timedelta(seconds=grace)
+
+    digests = db.scalars(
+        delete(Blob)
+        .where(Blob.ref_count <= 0, Blob.updated_at < cutoff)
+        .returning(Blob.hash)
+    ).all()
+    # Unlink before committing so concurrent uploads of the same content wait
+    # for us and then find the file gone
+    for digest in digests:
+        blob_path(digest).unlink(missing_ok=True)
+    db.commit()
+
+    removed = len(digests)
+    if not BLOB_ROOT.exists():
+        return removed
+    known = set(db.scalars(select(Blob.hash)))
+    for path in BLOB_ROOT.glob("*/*/*"):
+        modified = datetime.fromtimestamp(path.stat().st_mtime)
+        if path.name not in known and modified < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+
+    tmp_cutoff = datetime.now() - timedelta(seconds=settings.STORAGE["GC_GRACE"])
+    for path in (BLOB_ROOT / "tmp").glob("*"):
+        try:
+            modified = datetime.fromtimestamp(path.stat().st_mtime)
+        except FileNotFoundError:  # the upload finished meanwhile
+            continue
+        if modified < min(cutoff, tmp_cutoff):
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def _hash_file(path: Path) -> tuple[str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(settings.STORAGE["CHUNK_SIZE"]):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def migrate_media_tree(db: Session) -> dict[str, int]:
+    """Move every local file referenced by a track into the blob store.
+
+    Files are hard-linked into place (no copy) and the originals are removed
+    only once the rewritten track paths are committed, so an interrupted run
+    never loses a file. Duplicates end up sharing a single blob.
+    """
+    result = {"tracks": 0, "blobs": 0, "duplicates": 0, "bytes_saved": 0}
+    migrated: dict[str, str] = {}  # original path -> blob reference
+
+    for track in db.scalars(select(Track)).all():
+        sources = []
+        for field in ("file_path", "thumbnail_path"):
+            reference = getattr(track, field)
+            if not reference or reference_hash(reference):
+                continue
+
+            if reference not in migrated:
+                source = Path(reference)
+                if not source.is_absolute():
+                    source = BASE_DIR / source
+                if not source.is_file():
+                    continue
+
+                digest, size = _hash_file(source)
+                path = blob_path(digest)
+                if path.exists():
+                    result["duplicates"] += 1
+                    result["bytes_saved"] += size
+                else:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    try:
+                        os.link(source, path)
+                    except OSError:  # e.g. source on another filesystem
+                        shutil.copy2(source, path)
+                    result["blobs"] += 1
+                # References are counted by retain_reference below
+                db.execute(
+                    get_insert(db)(Blob)
+                    .values(hash=digest, size=size, ref_count=0)
+                    .on_conflict_do_nothing()
+                )
+                migrated[reference] = blob_reference(digest)
+                sources.append(source)
+
+            setattr(track, field, migrated[reference])
+            retain_reference(db, migrated[reference])
+
+        if db.dirty:
+            db.commit()
+            result["tracks"] += 1
+        for source in sources:
+            source.unlink(missing_ok=True)
+
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+
+    import users.models  # noqa: F401 -- registers every model with the mapper
+    from trek.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if sys.argv[1:] == ["migrate"]:
+            print(migrate_media_tree(db))
+        elif sys.argv[1:] == ["gc"]:
+            print(f"{collect_garbage(db, grace=0)} blobs removed")
+        else:
+            print(__doc__)
+    finally:
+        db.close()
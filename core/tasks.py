@@ -0,0 +1,96 @@
+"""Background job handlers for the core app."""
+
+import os
+import wave
+
+from trek.database import SessionLocal
+from trek.settings import BASE_DIR, get_settings
+from jobs.models import Job
+from jobs.worker import job, run_in_process
+from .models import Track
+from .purge import purge_deleted
+from .stats import reconcile
+from .storage import collect_garbage
+from .waveform import build_waveform, is_wav, waveform_path
+
+settings = get_settings()
+
+try:
+    import mutagen
+except ImportError:  # pragma: no cover - optional dependency
+    mutagen = None
+
+
+def read_audio_duration(file_path: str) -> int | None:
+    """Return the audio length in whole seconds, or None if it can't be read."""
+    if not os.path.isfile(file_path):
+        return None
+    if mutagen is not None:
+        audio = mutagen.File(file_path)
+        if audio is not None and audio.info is not None:
+            return round(audio.info.length)
+    if is_wav(file_path):
+        with wave.open(file_path) as audio:
+            return round(audio.getnframes() / audio.getframerate())
+    return None
+
+
+@job("probe_track_duration")
+async def probe_track_duration(track_id: int):
+    db = SessionLocal()
+    try:
+        track = Track.get(db, id=track_id)
+        if not track:
+            return
+        duration = await run_in_process(
+            read_audio_duration, str(BASE_DIR / track.file_path)
+        )
+        if duration is not None and duration != track.duration:
+            track.duration = duration
+            track.save(db)
+    finally:
+        db.close()
+
+
+@job("compute_waveform")
+async def compute_waveform(track_id: int):
+    db = SessionLocal()
+    try:
+        track = Track.get(db, id=track_id)
+    finally:
+        db.close()
+    if not track:
+        return
+    file_path = BASE_DIR / track.file_path
+    if not file_path.is_file():
+        return
+    await run_in_process(build_waveform, str(file_path), str(waveform_path(track_id)))
+
+
+@job("purge_deleted")
+async def purge_deleted_rows():
+    await purge_deleted()
+    # Purged tracks may have left media blobs unreferenced
+    db = SessionLocal()
+    try:
+        Job.enqueue(db, "collect_blobs", delay=settings.STORAGE["GC_GRACE"])
+    finally:
+        db.close()
+
+
+@job("collect_blobs")
+def collect_blobs():
+    db = SessionLocal()
+    try:
+        collect_garbage(db)
+    finally:
+        db.close()
+
+
+@job("reconcile_stats")
+def reconcile_stats():
+    db = SessionLocal()
+    try:
+        reconcile(db)
+    finally:
+        db.close()
@@ -1,8 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from trek.cache import cache, entity_cache
 from trek.database import get_db
+from trek.ratelimit import rate_limit
+from trek.settings import get_settings
+from trek.responses import ndjson_response, wants_ndjson
+from jobs.models import Job
 from users.models import User
-from .models import Track, Artist, Album
+from .fieldsets import (
+    TrackShape,
+    load_tracks,
+    parse_track_shape,
+    serialize_rows,
+    track_query,
+)
+from .models import Track, Artist, Album, ArtistStats, AlbumStats, track_artist
+from .radio import radio_graph
+from .stats import get_top_tracks
+from .storage import (
+    store_upload,
+    retain_reference,
+    release_reference,
+    replace_reference,
+)
+from .waveform import read_waveform, waveform_path
 from .schemas import (
     TrackCreateSchema,
     ArtistCreateSchema,
@@ -13,34 +44,87 @@ from .schemas import (
     AlbumCreateSchema,
     AlbumResponseSchema,
     TrackUpdateSchema,
+    ArtistStatsResponseSchema,
+    AlbumStatsResponseSchema,
+    RadioResponseSchema,
+    EntityCacheStatsResponseSchema,
 )
 
 router = APIRouter()
+settings = get_settings()
+
+# Track payloads embed the album and artists, so any of them invalidates
+TRACK_CACHE_TAGS = ("tracks", "artists", "albums")
+# Listings are returned pre-serialized and their shape depends on ``fields``
+# and ``include``, so the full shape is only documented, not validated
+TRACK_LIST_RESPONSES = {
+    200: {
+        "model": list[TrackResponseSchema],
+        "description": "Tracks; `fields` and `include` drop keys from each",
+    }
+}
+
+
+def get_track_shape(
+    fields: str | None = Query(
+        default=None, description="Comma-separated track fields to return"
+    ),
+    include: str | None = Query(
+        default=None, description="Related objects to embed: album, artists"
+    ),
+) -> TrackShape:
+    try:
+        return parse_track_shape(fields, include)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/trending-tracks/")
 async def get_trending_tracks(
     days: int | None = 7, limit: int | None = 10, db: Session = Depends(get_db)
 ):
-    # [(<Track()>, total_listens: int), ...]
-    trending_tracks = Track.get_top_trending_tracks(db, days, limit)
-    serialized_tracks = [
-        {
-            "id": track[0].id,
-            "name": track[0].name,
-            "duration": track[0].duration,
-            "file_path": track[0].file_path,
-            "total_listens": track[1],
-        }
-        for track in trending_tracks
-    ]
+    def compute():
+        # [(<Track()>, total_listens: int), ...]
+        trending_tracks = Track.get_top_trending_tracks(db, days, limit)
+        return [
+            {
+                "id": track[0].id,
+                "name": track[0].name,
+                "duration": track[0].duration,
+                "file_path": track[0].file_path,
+                "total_listens": track[1],
+            }
+            for track in trending_tracks
+        ]
+
+    # Listens don't go through BaseModel.save, so trending relies on the TTL
+    serialized_tracks = await cache.aget_or_set(
+        f"trending-tracks:{days}:{limit}", compute, tags=TRACK_CACHE_TAGS
+    )
     return {"trending_tracks": serialized_tracks}
 
 
-@router.get("/tracks/", response_model=list[TrackResponseSchema])
-async def get_tracks(db: Session = Depends(get_db)) -> [Track]:
-    tracks = Track.all(db)
-    return tracks
+@router.get("/tracks/", response_model=None, responses=TRACK_LIST_RESPONSES)
+async def get_tracks(
+    request: Request,
+    shape: TrackShape = Depends(get_track_shape),
+    db: Session = Depends(get_db),
+) -> [Track]:
+    if wants_ndjson(request):
+        return ndjson_response(
+            lambda stream_db: stream_db.execute(track_query(shape)),
+            serialize_batch=lambda stream_db, rows: serialize_rows(
+                stream_db, shape, rows
+            ),
+        )
+
+    return JSONResponse(
+        await cache.aget_or_set(
+            f"tracks:{shape.key}",
+            lambda: load_tracks(db, shape),
+            tags=TRACK_CACHE_TAGS,
+        )
+    )
 
 
 @router.post("/track/", status_code=201, response_model=TrackResponseSchema)
@@ -50,22 +134,36 @@ async def create_track(track_data: TrackCreateSchema, db: Session = Depends(get_
         name=track_data.name,
         duration=track_data.duration,
         file_path=track_data.file_path,
+        thumbnail_path=track_data.thumbnail_path,
         album_id=track_data.album_id,
     )
 
     # Save the track to the database using the inherited save method
     try:
+        if new_track.album_id is not None and not Album.get_cached(
+            db, id=new_track.album_id
+        ):
+            raise ValueError(f"Album with ID {new_track.album_id} not found")
+        retain_reference(db, new_track.file_path)
+        retain_reference(db, new_track.thumbnail_path)
         new_track.save(db)
+    except ValueError as ve:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))  # Handle any exceptions
 
+    # Duration from the client is provisional until the file is probed
+    Job.enqueue(db, "probe_track_duration", track_id=new_track.id)
+    Job.enqueue(db, "compute_waveform", track_id=new_track.id)
+
     if not track_data.artists_id:
         return new_track
 
     # Add artists to the track
     try:
         new_track.add_artists(db, track_data.artists_id)  # Associate artists
-        db.commit()  # Commit after adding artists
+        new_track.save(db)  # Commit after adding artists
     except ValueError as ve:
         db.rollback()
         raise HTTPException(status_code=404, detail=str(ve))  # Handle artist not found
@@ -84,16 +182,109 @@ async def update_track(
     if not track:
         raise HTTPException(status_code=404, detail="Track not found")
 
+    update_data = track_data.dict(exclude_unset=True)
     try:
-        for key, value in track_data.dict(exclude_unset=True).items():
+        if "artists_id" in update_data:
+            track.set_artists(db, update_data.pop("artists_id") or [])
+        if "album_id" in update_data:
+            track.set_album(db, update_data.pop("album_id"))
+        for field in ("file_path", "thumbnail_path"):
+            if field in update_data:
+                replace_reference(db, getattr(track, field), update_data[field])
+        for key, value in update_data.items():
             setattr(track, key, value)
         track.save(db)
+        if "file_path" in update_data:
+            Job.enqueue(db, "probe_track_duration", track_id=track.id)
+            Job.enqueue(db, "compute_waveform", track_id=track.id)
+        if update_data.keys() & {"file_path", "thumbnail_path"}:
+            Job.enqueue(db, "collect_blobs", delay=settings.STORAGE["GC_GRACE"])
+    except ValueError as ve:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=str(ve))
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
     return track
 
 
+async def replace_track_media(
+    db: Session, track: Track, field: str, upload: UploadFile
+) -> Track:
+    try:
+        reference = await store_upload(db, upload)
+        release_reference(db, getattr(track, field))
+        setattr(track, field, reference)
+        track.save(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    Job.enqueue(db, "collect_blobs", delay=settings.STORAGE["GC_GRACE"])
+    return track
+
+
+@router.put("/track/{track_id}/file/", response_model=TrackResponseSchema)
+async def upload_track_file(
+    track_id: int, file: UploadFile, db: Session = Depends(get_db)
+) -> Track:
+    track = Track.get(db, id=track_id)
+    if not track:
+        raise HTTPException(status_code=404, detail="Track not found")
+
+    track = await replace_track_media(db, track, "file_path", file)
+    Job.enqueue(db, "probe_track_duration", track_id=track.id)
+    Job.enqueue(db, "compute_waveform", track_id=track.id)
+    return track
+
+
+@router.put("/track/{track_id}/thumbnail/", response_model=TrackResponseSchema)
+async def upload_track_thumbnail(
+    track_id: int, file: UploadFile, db: Session = Depends(get_db)
+) -> Track:
+    track = Track.get(db, id=track_id)
+    if not track:
+        raise HTTPException(status_code=404, detail="Track not found")
+
+    return await replace_track_media(db, track, "thumbnail_path", file)
+
+
+@router.get("/track/{track_id}/waveform")
+async def get_track_waveform(
+    track_id: int, resolution: int | None = None, db: Session = Depends(get_db)
+):
+    """Raw int8 (min, max) peak pairs; ``resolution`` is samples per peak."""
+    track = Track.get(db, id=track_id)
+    if not track:
+        raise HTTPException(status_code=404, detail="Track not found")
+
+    try:
+        waveform = read_waveform(waveform_path(track_id), resolution)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Waveform not computed yet")
+    except LookupError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported resolution, available: {e.args[0]}",
+        )
+    except ValueError:
+        # Corrupt sidecar, e.g. a partial copy; rebuild it from the audio
+        Job.enqueue(db, "compute_waveform", track_id=track_id)
+        raise HTTPException(
+            status_code=500, detail="Waveform file is corrupt, recomputing it"
+        )
+
+    return StreamingResponse(
+        waveform["data"],
+        media_type="application/octet-stream",
+        headers={
+            "X-Sample-Rate": str(waveform["sample_rate"]),
+            "X-Samples-Per-Peak": str(waveform["samples_per_peak"]),
+            "X-Peak-Count": str(waveform["peak_count"]),
+        },
+    )
+
+
 @router.delete("/track/")
 async def delete_track(track_data: TrackDeleteSchema, db: Session = Depends(get_db)):
     track = Track.get(db, id=track_data.id)
@@ -102,12 +293,52 @@ async def delete_track(track_data: TrackDeleteSchema, db: Session = Depends(get_
 
     try:
         track.delete(db)
+        Job.enqueue_once(db, "purge_deleted")
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to delete track")
 
     return {"message": f"Track '{track.name}' deleted successfully"}
 
 
+@router.get("/radio/", response_model=RadioResponseSchema)
+async def get_radio(
+    track_id: int | None = None,
+    artist_id: int | None = None,
+    limit: int = 25,
+    exclude: list[int] = Query(default=[]),
+    db: Session = Depends(get_db),
+):
+    """Next ``limit`` tracks of a radio seeded by a track or an artist.
+
+    Pass the ids already queued as ``exclude`` to continue the same radio.
+    """
+    if (track_id is None) == (artist_id is None):
+        raise HTTPException(
+            status_code=400, detail="Provide exactly one of track_id or artist_id"
+        )
+    limit = max(1, min(limit, settings.RADIO["MAX_LIMIT"]))
+    if track_id is not None and not Track.get_cached(db, id=track_id):
+        raise HTTPException(status_code=404, detail="Track not found")
+    if artist_id is not None and not Artist.get_cached(db, id=artist_id):
+        raise HTTPException(status_code=404, detail="Artist not found")
+
+    await radio_graph.ensure_fresh()
+    track_ids = radio_graph.generate(
+        track_id=track_id, artist_id=artist_id, limit=limit, exclude=set(exclude)
+    )
+    if not track_ids:
+        # Everything reachable was excluded, or the seed isn't in the graph yet
+        return {"tracks": []}
+
+    tracks = {
+        track.id: track
+        for track in Track.active(db)
+        .filter(Track.id.in_(track_ids))
+        .options(selectinload(Track.artists), selectinload(Track.album))
+    }
+    return {"tracks": [tracks[id] for id in track_ids if id in tracks]}
+
+
 @router.get("/artists/", response_model=list[ArtistResponseSchema])
 async def get_artists(db: Session = Depends(get_db)) -> [Artist]:
     artists = Artist.all(db)
@@ -121,6 +352,8 @@ async def create_artist(
     try:
         new_artist = Artist(name=artist_data.name)
         new_artist.save(db)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Artist already exists")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     return new_artist
@@ -134,19 +367,55 @@ async def delete_artist(artist_data: ArtistCreateSchema, db: Session = Depends(g
 
     try:
         artist.delete(db)
+        Job.enqueue_once(db, "purge_deleted")
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to delete artist")
 
     return {"message": f"Artist '{artist.name}' deleted successfully"}
 
 
-@router.get("/artist/{artist_id}/tracks/", response_model=list[TrackResponseSchema])
-async def get_artist_tracks(artist_id: int, db: Session = Depends(get_db)) -> [Track]:
-    artist = Artist.get(db, id=artist_id)
+@router.get(
+    "/artist/{artist_id}/tracks/",
+    response_model=None,
+    responses=TRACK_LIST_RESPONSES,
+)
+async def get_artist_tracks(
+    artist_id: int,
+    shape: TrackShape = Depends(get_track_shape),
+    db: Session = Depends(get_db),
+) -> [Track]:
+    if not Artist.get_cached(db, id=artist_id):
+        raise HTTPException(status_code=404, detail="Artist not found")
+
+    tracks = await cache.aget_or_set(
+        f"artist-tracks:{artist_id}:{shape.key}",
+        lambda: load_tracks(
+            db,
+            shape,
+            Track.id.in_(
+                select(track_artist.c.track_id).where(
+                    track_artist.c.artist_id == artist_id
+                )
+            ),
+        ),
+        tags=TRACK_CACHE_TAGS,
+    )
+    return JSONResponse(tracks)
+
+
+@router.get("/artist/{artist_id}/stats/", response_model=ArtistStatsResponseSchema)
+async def get_artist_stats(artist_id: int, db: Session = Depends(get_db)):
+    artist = Artist.get_cached(db, id=artist_id)
     if not artist:
         raise HTTPException(status_code=404, detail="Artist not found")
 
-    return artist.tracks
+    stats = db.get(ArtistStats, artist_id)
+    return {
+        "artist_id": artist_id,
+        "total_plays": stats.total_plays if stats else 0,
+        "listener_count": stats.listener_count if stats else 0,
+        "top_tracks": get_top_tracks(db, artist_id=artist_id),
+    }
 
 
 @router.get("/albums/", response_model=list[AlbumResponseSchema])
@@ -164,17 +433,42 @@ async def create_album(
     return new_album
 
 
-@router.post("/listen/", status_code=201)
+@router.get("/albums/{album_id}/stats/", response_model=AlbumStatsResponseSchema)
+async def get_album_stats(album_id: int, db: Session = Depends(get_db)):
+    album = Album.get_cached(db, id=album_id)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+
+    stats = db.get(AlbumStats, album_id)
+    return {
+        "album_id": album_id,
+        "total_plays": stats.total_plays if stats else 0,
+        "listener_count": stats.listener_count if stats else 0,
+        "top_tracks": get_top_tracks(db, album_id=album_id),
+    }
+
+
+@router.post(
+    "/listen/",
+    status_code=201,
+    dependencies=[Depends(rate_limit("listen", key_field="user_id"))],
+)
 async def listen_to_track(
     credentials: ListenToTrackSchema, db: Session = Depends(get_db)
 ):
-    user = User.get(db, id=credentials.user_id)
+    user = User.get_cached(db, id=credentials.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    track = Track.get(db, id=credentials.track_id)
+    track = Track.get_cached(db, id=credentials.track_id)
     if not track:
         raise HTTPException(status_code=404, detail="Track not found")
 
-    user.listen_to_track(db, credentials.track_id)
+    User.listen_by_id(db, user.id, track.id)
     return {"message": "Track listened successfully"}
+
+
+@router.get("/entity-cache/stats/", response_model=EntityCacheStatsResponseSchema)
+async def get_entity_cache_stats():
+    """Hit rates of this worker's entity cache since it started."""
+    return entity_cache.stats()
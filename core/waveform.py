@@ -0,0 +1,227 @@
+"""Precomputed waveform peaks, stored as a binary sidecar next to each track.
+
+Sidecar layout (little-endian):
+    header  b"TRKW", u16 version, u32 sample rate, u16 level count
+    levels  per level: u32 samples per peak, u32 peak count, u64 data offset
+    data    per level: int8 (min, max) pairs scaled to [-127, 127]
+"""
+
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import wave
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from trek.settings import get_settings
+
+settings = get_settings()
+
+MAGIC = b"TRKW"
+VERSION = 1
+HEADER = struct.Struct("<4sHIH")
+LEVEL = struct.Struct("<IIQ")
+
+CHUNK_FRAMES = 1 << 16  # frames decoded per step
+STREAM_CHUNK = 1 << 16  # bytes sent per response chunk
+FFMPEG_SAMPLE_RATE = 44100
+
+
+def waveform_path(track_id: int) -> Path:
+    return settings.MEDIA_ROOT / "tracks" / str(track_id) / "waveform.bin"
+
+
+def _wav_chunks(file_path: str) -> tuple[int, Iterator[np.ndarray]]:
+    audio = wave.open(file_path)
+    channels, width = audio.getnchannels(), audio.getsampwidth()
+
+    def chunks():
+        with audio:
+            while True:
+                raw = audio.readframes(CHUNK_FRAMES)
+                if not raw:
+                    return
+                if width == 1:
+                    samples = np.frombuffer(raw, np.uint8).astype(np.float32) - 128
+                    scale = 128
+                elif width == 2:
+                    samples = np.frombuffer(raw, "<i2").astype(np.float32)
+                    scale = 1 << 15
+                elif width == 3:
+                    # Widen 24-bit samples into the top of an int32
+                    triples = np.frombuffer(raw, np.uint8).reshape(-1, 3)
+                    padded = np.zeros((len(triples), 4), np.uint8)
+                    padded[:, 1:] = triples
+                    samples = padded.view("<i4").ravel().astype(np.float32)
+                    scale = 1 << 31
+                else:
+                    samples = np.frombuffer(raw, "<i4").astype(np.float32)
+                    scale = 1 << 31
+                # Mix down to mono
+                yield samples.reshape(-1, channels).mean(axis=1) / scale
+
+    return audio.getframerate(), chunks()
+
+
+def _ffmpeg_chunks(file_path: str) -> tuple[int, Iterator[np.ndarray]]:
+    def chunks():
+        process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-v",
+                "error",
+                "-i",
+                file_path,
+                "-f",
+                "s16le",
+                "-ac",
+                "1",
+                "-ar",
+                str(FFMPEG_SAMPLE_RATE),
+                "-",
+            ],
+            stdout=subprocess.PIPE,
+        )
+        try:
+            while raw := process.stdout.read(CHUNK_FRAMES * 2):
+                # A read may end mid-sample; drop the odd byte
+                raw = raw[: len(raw) // 2 * 2]
+                yield np.frombuffer(raw, "<i2").astype(np.float32) / (1 << 15)
+        finally:
+            process.stdout.close()
+            if process.wait() != 0:
+                raise ValueError(f"ffmpeg could not decode {file_path}")
+
+    return FFMPEG_SAMPLE_RATE, chunks()
+
+
+def is_wav(file_path: str) -> bool:
+    # Blob paths carry no extension, so sniff the RIFF header instead
+    with open(file_path, "rb") as f:
+        header = f.read(12)
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def pcm_chunks(file_path: str) -> tuple[int, Iterator[np.ndarray]]:
+    """Return the sample rate and an iterator of mono float32 sample chunks."""
+    if is_wav(file_path):
+        return _wav_chunks(file_path)
+    if shutil.which("ffmpeg"):
+        return _ffmpeg_chunks(file_path)
+    raise ValueError(f"Cannot decode {file_path}: not WAV and ffmpeg is not installed")
+
+
+def compute_peaks(chunks: Iterator[np.ndarray], samples_per_peak: int) -> np.ndarray:
+    """Min/max pairs over consecutive windows, shape (n, 2), in float32."""
+    peaks = []
+    carry = np.empty(0, np.float32)
+    for chunk in chunks:
+        samples = np.concatenate((carry, chunk)) if len(carry) else chunk
+        usable = len(samples) // samples_per_peak * samples_per_peak
+        windows = samples[:usable].reshape(-1, samples_per_peak)
+        peaks.append(np.stack((windows.min(axis=1), windows.max(axis=1)), axis=1))
+        carry = samples[usable:]
+    if len(carry):
+        peaks.append(np.array([[carry.min(), carry.max()]], np.float32))
+    return np.concatenate(peaks) if peaks else np.empty((0, 2), np.float32)
+
+
+def downsample_peaks(peaks: np.ndarray, factor: int) -> np.ndarray:
+    """Merge every ``factor`` consecutive pairs into one."""
+    if not len(peaks):
+        return peaks
+    count = -(-len(peaks) // factor)
+    padded = np.pad(peaks, ((0, count * factor - len(peaks)), (0, 0)), mode="edge")
+    groups = padded.reshape(count, factor, 2)
+    return np.stack((groups[:, :, 0].min(axis=1), groups[:, :, 1].max(axis=1)), axis=1)
+
+
+def build_waveform(file_path: str, out_path: str) -> str:
+    """Decode the audio once and write every zoom level to the sidecar file."""
+    levels = sorted(settings.WAVEFORM["LEVELS"])
+    sample_rate, chunks = pcm_chunks(file_path)
+
+    base = compute_peaks(chunks, levels[0])
+    level_peaks = [base] + [
+        downsample_peaks(base, samples_per_peak // levels[0])
+        for samples_per_peak in levels[1:]
+    ]
+
+    offset = HEADER.size + LEVEL.size * len(levels)
+    table, data = [], []
+    for samples_per_peak, peaks in zip(levels, level_peaks):
+        encoded = np.clip(np.round(peaks * 127), -127, 127).astype(np.int8)
+        table.append(LEVEL.pack(samples_per_peak, len(peaks), offset))
+        data.append(encoded.tobytes())
+        offset += encoded.nbytes
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, sample_rate, len(levels)))
+        f.writelines(table)
+        f.writelines(data)
+    os.replace(tmp_path, out_path)
+    return str(out_path)
+
+
+def _stream(
+    resources: ExitStack, mm: mmap.mmap, start: int, end: int
+) -> Iterator[bytes]:
+    """Yield ``mm[start:end]`` in chunks, closing the map once done."""
+    with resources:
+        for offset in range(start, end, STREAM_CHUNK):
+            yield mm[offset : min(offset + STREAM_CHUNK, end)]
+
+
+def _read_levels(mm: mmap.mmap, path: Path) -> tuple[int, dict[int, tuple]]:
+    try:
+        magic, version, sample_rate, level_count = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a waveform file")
+        levels = {}
+        for index in range(level_count):
+            spp, count, offset = LEVEL.unpack_from(mm, HEADER.size + index * LEVEL.size)
+            if offset + count * 2 > len(mm):
+                raise ValueError(f"{path} is truncated")
+            levels[spp] = (count, offset)
+    except struct.error:
+        raise ValueError(f"{path} is truncated")
+    if not levels:
+        raise ValueError(f"{path} has no levels")
+    return sample_rate, levels
+
+
+def read_waveform(path: Path, samples_per_peak: int | None = None) -> dict:
+    """Open one zoom level of a sidecar through a memory map.
+
+    Defaults to the finest level. ``data`` streams the peaks straight from the
+    map, which stays open until it is exhausted. Raises ``LookupError`` for an
+    unknown level and ``ValueError`` for a corrupt sidecar.
+    """
+    with ExitStack() as resources:
+        f = resources.enter_context(open(path, "rb"))
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{path} is empty")
+        mm = resources.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        sample_rate, levels = _read_levels(mm, path)
+
+        if samples_per_peak is None:
+            samples_per_peak = min(levels)
+        if samples_per_peak not in levels:
+            raise LookupError(sorted(levels))
+
+        count, offset = levels[samples_per_peak]
+        return {
+            "sample_rate": sample_rate,
+            "samples_per_peak": samples_per_peak,
+            "peak_count": count,
+            # The stream takes over closing the map and the file
+            "data": _stream(resources.pop_all(), mm, offset, offset + count * 2),
+        }
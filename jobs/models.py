@@ -0,0 +1,221 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Text,
+    DateTime,
+    JSON,
+    Index,
+    delete,
+    select,
+    update,
+    func,
+)
+from sqlalchemy.orm import Session
+
+from trek.database import Base
+from trek.settings import get_settings
+
+settings = get_settings()
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "run_at"),
+        Index("ix_jobs_finished_at", "finished_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String(10), nullable=False, default=QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    last_error = Column(Text, nullable=True)
+    locked_by = Column(String(64), nullable=True)
+    run_at = Column(DateTime, nullable=False, default=datetime.now)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Refreshed by the worker while the job runs; see ``requeue_stale``
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    @classmethod
+    def enqueue(cls, db: Session, name: str, delay: int = 0, **payload) -> "Job":
+        """Add a job to the queue and commit it. ``payload`` must be JSON-serialisable."""
+        job = cls(
+            name=name,
+            payload=payload,
+            max_attempts=settings.JOBS["MAX_ATTEMPTS"],
+            run_at=datetime.now() + timedelta(seconds=delay),
+        )
+        db.add(job)
+        db.commit()
+        return job
+
+    @classmethod
+    def enqueue_once(cls, db: Session, name: str) -> "Job":
+        """Enqueue a job that drains all pending work, unless one is already waiting.
+
+        A queued job will pick up whatever this call would have; a running one
+        may already be past it, so it doesn't count.
+        """
+        queued = db.scalar(
+            select(cls).where(cls.name == name, cls.status == QUEUED).limit(1)
+        )
+        return queued or cls.enqueue(db, name)
+
+    @classmethod
+    def claim(cls, db: Session, worker_id: str, limit: int = 1) -> list[tuple]:
+        """Atomically mark due jobs as running and return ``(id, name, payload)``.
+
+        On Postgres concurrent workers skip each other's rows with
+        ``FOR UPDATE SKIP LOCKED``. SQLite ignores the locking clause, but it
+        serialises writers, so the single UPDATE is atomic there as well.
+        """
+        now = datetime.now()
+        due = (
+            select(cls.id)
+            .where(cls.status == QUEUED, cls.run_at <= now)
+            .order_by(cls.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        rows = db.execute(
+            update(cls)
+            .where(cls.id.in_(due))
+            .values(
+                status=RUNNING,
+                locked_by=worker_id,
+                started_at=now,
+                heartbeat_at=now,
+                attempts=cls.attempts + 1,
+            )
+            .returning(cls.id, cls.name, cls.payload)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        return [tuple(row) for row in rows]
+
+    @classmethod
+    def complete(cls, db: Session, job_id: int):
+        db.execute(
+            update(cls)
+            .where(cls.id == job_id)
+            .values(status=DONE, finished_at=datetime.now(), locked_by=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+    @classmethod
+    def fail(cls, db: Session, job_id: int, error: str):
+        """Schedule a retry with exponential backoff, or give up after max_attempts."""
+        job = db.get(cls, job_id)
+        now = datetime.now()
+        job.last_error = error
+        job.locked_by = None
+        if job.attempts >= job.max_attempts:
+            job.status = FAILED
+            job.finished_at = now
+        else:
+            job.status = QUEUED
+            backoff = settings.JOBS["BACKOFF"] * 2 ** (job.attempts - 1)
+            job.run_at = now + timedelta(seconds=backoff)
+        db.commit()
+
+    @classmethod
+    def heartbeat(cls, db: Session, job_id: int):
+        """Mark a running job as still alive."""
+        db.execute(
+            update(cls)
+            .where(cls.id == job_id, cls.status == RUNNING)
+            .values(heartbeat_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+    @classmethod
+    def requeue_stale(cls, db: Session) -> int:
+        """Put back jobs whose worker died while running them."""
+        cutoff = datetime.now() - timedelta(seconds=settings.JOBS["LOCK_TIMEOUT"])
+        count = db.execute(
+            update(cls)
+            .where(
+                cls.status == RUNNING,
+                func.coalesce(cls.heartbeat_at, cls.started_at) < cutoff,
+            )
+            .values(status=QUEUED, locked_by=None, run_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return count
+
+    @classmethod
+    def delete_finished(cls, db: Session, batch_size: int = 1000) -> int:
+        """Delete up to ``batch_size`` jobs finished longer than the retention ago."""
+        cutoff = datetime.now() - timedelta(seconds=settings.JOBS["RETENTION"])
+        expired = (
+            select(cls.id)
+            .where(cls.finished_at < cutoff, cls.status.in_((DONE, FAILED)))
+            .limit(batch_size)
+        )
+        count = db.execute(
+            delete(cls)
+            .where(cls.id.in_(expired))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return count
+
+    @classmethod
+    def get_stats(cls, db: Session, window: int = 3600) -> dict:
+        """Queue depth per status plus wait/run latency of recently finished jobs."""
+        counts = dict(
+            db.execute(select(cls.status, func.count()).group_by(cls.status)).all()
+        )
+        oldest_queued = db.scalar(
+            select(func.min(cls.run_at)).where(
+                cls.status == QUEUED, cls.run_at <= datetime.now()
+            )
+        )
+        recent = db.execute(
+            # Wait is measured from when a job became due, so delayed jobs and
+            # retry backoff don't count as queueing time
+            select(cls.run_at, cls.started_at, cls.finished_at).where(
+                cls.status == DONE,
+                cls.finished_at >= datetime.now() - timedelta(seconds=window),
+            )
+        ).all()
+
+        def average(values):
+            return sum(values) / len(values) if values else None
+
+        return {
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "oldest_queued_seconds": (
+                (datetime.now() - oldest_queued).total_seconds()
+                if oldest_queued
+                else None
+            ),
+            "recent_completed": len(recent),
+            "avg_wait_seconds": average(
+                [(started - due).total_seconds() for due, started, _ in recent]
+            ),
+            "avg_run_seconds": average(
+                [
+                    (finished - started).total_seconds()
+                    for _, started, finished in recent
+                ]
+            ),
+        }
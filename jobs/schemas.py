@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+
+class JobStatsResponseSchema(BaseModel):
+    queued: int
+    running: int
+    done: int
+    failed: int
+    oldest_queued_seconds: float | None
+    recent_completed: int
+    avg_wait_seconds: float | None
+    avg_run_seconds: float | None
@@ -0,0 +1,6 @@
+from fastapi import APIRouter
+from .views import router as jobs_router
+
+router = APIRouter()
+
+router.include_router(jobs_router, prefix="/jobs", tags=["jobs"])
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from trek.database import get_db
+from .models import Job
+from .schemas import JobStatsResponseSchema
+
+router = APIRouter()
+
+
+@router.get("/stats/", response_model=JobStatsResponseSchema)
+async def get_job_stats(window: int = 3600, db: Session = Depends(get_db)):
+    return Job.get_stats(db, window)
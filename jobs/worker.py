@@ -0,0 +1,173 @@
+"""Asyncio worker pool executing queued jobs.
+
+Handlers are registered with ``@job("name")`` in the modules listed in
+``settings.JOBS["MODULES"]``. Coroutine handlers run on the event loop, plain
+functions run in a thread, and CPU-bound work can be pushed to the shared
+process pool with ``await run_in_process(fn, *args)``.
+
+The pool runs inside the app (see ``main.lifespan``) or standalone with
+``python -m jobs.worker``.
+"""
+
+import asyncio
+import importlib
+import inspect
+import logging
+import multiprocessing
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+from trek.database import SessionLocal
+from trek.settings import get_settings
+from .models import Job
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+registry: dict[str, Callable] = {}
+process_pool: ProcessPoolExecutor | None = None
+
+
+def job(name: str):
+    """Register a function as the handler for jobs called ``name``."""
+
+    def decorator(func: Callable) -> Callable:
+        registry[name] = func
+        return func
+
+    return decorator
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global process_pool
+    if process_pool is None:
+        process_pool = ProcessPoolExecutor(
+            max_workers=settings.JOBS["PROCESSES"],
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return process_pool
+
+
+async def run_in_process(func: Callable, *args):
+    """Run a picklable, module-level function in the worker process pool.
+
+    A child process dying (OOM kill, segfault) breaks the whole pool; it is
+    replaced and the call retried once, so one crash doesn't fail every later
+    job.
+    """
+    global process_pool
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = _get_process_pool()
+        try:
+            return await loop.run_in_executor(pool, func, *args)
+        except BrokenProcessPool:
+            logger.warning("Process pool broke running %s, restarting", func.__name__)
+            # Concurrent callers may have replaced it already
+            if process_pool is pool:
+                process_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            if attempt:
+                raise
+
+
+def _with_session(method: Callable, *args):
+    db = SessionLocal()
+    try:
+        return method(db, *args)
+    finally:
+        db.close()
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        concurrency: int | None = None,
+        poll_interval: float | None = None,
+    ):
+        self.concurrency = concurrency or settings.JOBS["CONCURRENCY"]
+        self.poll_interval = poll_interval or settings.JOBS["POLL_INTERVAL"]
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        for module in settings.JOBS["MODULES"]:
+            importlib.import_module(module)
+        self.tasks = [
+            asyncio.create_task(self.work(index)) for index in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        global process_pool
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if process_pool is not None:
+            process_pool.shutdown(wait=False, cancel_futures=True)
+            process_pool = None
+
+    async def work(self, index: int):
+        while True:
+            try:
+                claimed = await asyncio.to_thread(
+                    _with_session, Job.claim, f"{self.worker_id}:{index}"
+                )
+                if not claimed:
+                    if index == 0:
+                        await asyncio.to_thread(_with_session, Job.requeue_stale)
+                        await asyncio.to_thread(_with_session, Job.delete_finished)
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                for job_id, name, payload in claimed:
+                    await self.run(job_id, name, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job worker %s crashed, restarting", index)
+                await asyncio.sleep(self.poll_interval)
+
+    async def heartbeat(self, job_id: int):
+        """Keep a long-running job from being requeued as stale."""
+        while True:
+            await asyncio.sleep(settings.JOBS["HEARTBEAT"])
+            try:
+                await asyncio.to_thread(_with_session, Job.heartbeat, job_id)
+            except Exception:
+                logger.exception("Heartbeat of job %s failed", job_id)
+
+    async def run(self, job_id: int, name: str, payload: dict):
+        handler = registry.get(name)
+        heartbeat = asyncio.create_task(self.heartbeat(job_id))
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job '{name}'")
+            if inspect.iscoroutinefunction(handler):
+                await handler(**payload)
+            else:
+                await asyncio.to_thread(handler, **payload)
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job_id, name)
+            await asyncio.to_thread(_with_session, Job.fail, job_id, repr(e))
+        else:
+            await asyncio.to_thread(_with_session, Job.complete, job_id)
+        finally:
+            heartbeat.cancel()
+
+
+if __name__ == "__main__":
+    import users.models  # noqa: F401 -- registers every model with the mapper
+
+    async def main():
+        pool = WorkerPool()
+        await pool.start()
+        try:
+            await asyncio.gather(*pool.tasks)
+        finally:
+            await pool.stop()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -3,15 +3,34 @@
 #
 # sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from contextlib import asynccontextmanager
+
 from trek.database import engine, Base
 from fastapi import FastAPI
 from users.urls import router as users_router
 from core.urls import router as core_router
+from jobs.urls import router as jobs_router
+from jobs.worker import WorkerPool
 from fastapi.middleware.cors import CORSMiddleware
+from trek.compression import CompressionMiddleware
+from trek.settings import get_settings
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not get_settings().JOBS["RUN_IN_APP"]:
+        yield
+        return
+
+    worker_pool = WorkerPool()
+    await worker_pool.start()
+    yield
+    await worker_pool.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow all origins (use caution in production)
 app.add_middleware(
@@ -21,9 +40,11 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods (GET, POST, etc.)
     allow_headers=["*"],  # Allows all headers
 )
+app.add_middleware(CompressionMiddleware)
 
 app.include_router(users_router)
 app.include_router(core_router)
+app.include_router(jobs_router)
 
 if __name__ == "__main__":
     import uvicorn
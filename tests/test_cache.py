@@ -0,0 +1,160 @@
+import asyncio
+import shutil
+import socket
+import subprocess
+import time
+from collections import namedtuple
+
+import pytest
+
+from trek import cache as cache_module
+from trek.cache import EntityCache, LocalCache, RedisCache
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def redis_url():
+    if shutil.which("redis-server") is None:
+        pytest.skip("redis-server is not installed")
+
+    port = free_port()
+    process = subprocess.Popen(
+        ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 5
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), 0.1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    pytest.fail("redis-server did not start")
+                time.sleep(0.05)
+        yield f"redis://127.0.0.1:{port}/1"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@pytest.fixture(params=["local", "redis"])
+def backend(request):
+    if request.param == "local":
+        yield LocalCache(max_entries=16)
+        return
+    url = request.getfixturevalue("redis_url")
+    cache = RedisCache(url, prefix=f"test:{time.monotonic_ns()}:")
+    yield cache
+    cache.close()
+
+
+def test_get_set_delete(backend):
+    assert backend.get("missing") is None
+    backend.set("key", {"a": [1, 2]}, ttl=60)
+    assert backend.get("key") == {"a": [1, 2]}
+    assert backend.get_many(["key", "missing"]) == [{"a": [1, 2]}, None]
+    backend.delete("key")
+    assert backend.get("key") is None
+
+
+def test_incr_and_invalidate(backend):
+    assert backend.incr("counter") == 1
+    assert backend.incr("counter") == 2
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert backend.get_or_set("value", compute, tags=("tracks",)) == 1
+    assert backend.get_or_set("value", compute, tags=("tracks",)) == 1
+    backend.invalidate("tracks")
+    assert backend.tag_version("tracks") == 1
+    assert backend.get_or_set("value", compute, tags=("tracks",)) == 2
+
+
+def test_lock_is_exclusive(backend):
+    token = backend.acquire("lock:key", ttl=10)
+    assert token
+    assert backend.acquire("lock:key", ttl=10) is None
+    backend.release("lock:key", "someone else")
+    assert backend.acquire("lock:key", ttl=10) is None
+    backend.release("lock:key", token)
+    assert backend.acquire("lock:key", ttl=10)
+
+
+def test_async_get_or_set(backend):
+    async def main():
+        return await backend.aget_or_set("async", lambda: "computed")
+
+    assert asyncio.run(main()) == "computed"
+    assert backend.get("async") == "computed"
+
+
+def test_redis_reconnects(redis_url):
+    cache = RedisCache(redis_url, prefix=f"test:{time.monotonic_ns()}:")
+    cache.set("key", 1, ttl=60)
+    cache.sock.close()  # simulate a dropped connection
+    assert cache.get("key") == 1
+
+
+def test_unreachable_redis_falls_back_to_compute():
+    cache = RedisCache(f"redis://127.0.0.1:{free_port()}/0", timeout=0.1)
+    assert cache.get_or_set("key", lambda: "computed", tags=("tracks",)) == "computed"
+    assert asyncio.run(cache.aget_or_set("key", lambda: "async")) == "async"
+    cache.invalidate("tracks")  # logged, not raised
+
+
+def test_redis_fails_fast_while_down(monkeypatch):
+    clock = [1000.0]
+    connects = []
+
+    def create_connection(address, timeout):
+        connects.append(address)
+        raise ConnectionRefusedError
+
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(cache_module.socket, "create_connection", create_connection)
+    cache = RedisCache("redis://127.0.0.1:6379/0", cooldown=5)
+
+    for _ in range(3):
+        with pytest.raises(OSError):
+            cache.get("key")
+    assert len(connects) == 1
+    clock[0] += 6
+    with pytest.raises(OSError):
+        cache.get("key")
+    assert len(connects) == 2
+
+
+def test_entity_cache_entries_expire(monkeypatch):
+    class Row:
+        __tablename__ = "rows"
+        cache_fields = ("id",)
+
+    Snapshot = namedtuple("Snapshot", ["id", "name"])
+    clock = [1000.0]
+    loads = []
+
+    def load(db, model, id):
+        loads.append(id)
+        return Snapshot(id, f"load {len(loads)}")
+
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: clock[0])
+    entities = EntityCache(LocalCache(max_entries=16), max_entries=16, ttl=60)
+    monkeypatch.setattr(entities, "load", load)
+
+    assert entities.get(None, Row, id=1).name == "load 1"
+    clock[0] += 59
+    assert entities.get(None, Row, id=1).name == "load 1"
+    # Another process may have changed the row without this backend noticing
+    clock[0] += 2
+    assert entities.get(None, Row, id=1).name == "load 2"
+    assert loads == [1, 1]
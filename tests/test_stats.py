@@ -0,0 +1,264 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.orm import sessionmaker
+
+import users.models  # noqa: F401 -- registers every model with the mapper
+from core import purge, stats
+from core.models import (
+    Album,
+    AlbumStats,
+    Artist,
+    ArtistStats,
+    Track,
+    TrackStats,
+    UserPeriodStats,
+)
+from core.stats import USER_PERIOD_MODELS, rebuild_user_stats, reconcile
+from trek.cache import entity_cache
+from trek.database import Base
+from users.models import User, UserTrack
+
+
+@pytest.fixture
+def Session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/test.sqlite3")
+    Base.metadata.create_all(engine)
+    # Row ids are random, so snapshots of another test's rows could match
+    entity_cache.entries.clear()
+    yield sessionmaker(autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def catalog(Session):
+    """Two tracks by one artist on one album, each heard twice by two users."""
+    db = Session()
+    artist = Artist(name="Artist")
+    album = Album(name="Album", release_year=2024)
+    db.add_all([artist, album])
+    db.commit()
+    tracks = [
+        Track(name=f"Track {i}", duration=100, file_path="x", album_id=album.id)
+        for i in range(2)
+    ]
+    for track in tracks:
+        track.artists.append(artist)
+    users = [User(username=f"user{i}", password="-") for i in range(2)]
+    db.add_all([*tracks, *users])
+    db.commit()
+    for user in users:
+        for track in tracks:
+            for _ in range(2):
+                User.listen_by_id(db, user.id, track.id)
+    ids = {
+        "artist": artist.id,
+        "album": album.id,
+        "tracks": [track.id for track in tracks],
+        "users": [user.id for user in users],
+    }
+    db.close()
+    return ids
+
+
+def counts(db, model, key, value):
+    row = db.execute(
+        select(model.total_plays, model.listener_count).where(key == value)
+    ).one_or_none()
+    return tuple(row) if row else (0, 0)
+
+
+def assert_no_drift(db):
+    assert set(reconcile(db, fix=False).values()) == {0}
+
+
+def test_listens_are_counted(Session, catalog):
+    db = Session()
+    track_id = catalog["tracks"][0]
+    assert counts(db, TrackStats, TrackStats.track_id, track_id) == (4, 2)
+    artist = counts(db, ArtistStats, ArtistStats.artist_id, catalog["artist"])
+    assert artist == (8, 2)
+    assert counts(db, AlbumStats, AlbumStats.album_id, catalog["album"]) == (8, 2)
+    assert_no_drift(db)
+
+
+def test_relinking_moves_listens(Session, catalog):
+    db = Session()
+    other = Artist(name="Other")
+    db.add(other)
+    db.commit()
+
+    track = db.get(Track, catalog["tracks"][0])
+    track.set_artists(db, [other.id])
+    track.set_album(db, None)
+    db.commit()
+
+    assert counts(db, ArtistStats, ArtistStats.artist_id, other.id) == (4, 2)
+    artist = counts(db, ArtistStats, ArtistStats.artist_id, catalog["artist"])
+    assert artist == (4, 2)
+    assert counts(db, AlbumStats, AlbumStats.album_id, catalog["album"]) == (4, 2)
+    assert_no_drift(db)
+
+
+def test_purging_a_track_withdraws_its_listens(Session, catalog):
+    db = Session()
+    db.get(Track, catalog["tracks"][0]).delete(db)
+    while purge.purge_batch(db, 500):
+        pass
+
+    assert db.get(Track, catalog["tracks"][0]) is None
+    assert counts(db, TrackStats, TrackStats.track_id, catalog["tracks"][0]) == (0, 0)
+    artist = counts(db, ArtistStats, ArtistStats.artist_id, catalog["artist"])
+    assert artist == (4, 2)
+    assert_no_drift(db)
+
+
+def test_concurrent_purges_withdraw_listens_once(Session, catalog, monkeypatch):
+    db = Session()
+    db.get(Track, catalog["tracks"][0]).delete(db)
+    db.close()
+
+    # Hold both purges just before withdrawing, so they overlap
+    barrier = threading.Barrier(2, timeout=2)
+    withdraw_listens = purge.withdraw_listens
+
+    def withdraw_together(db, listens):
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        withdraw_listens(db, listens)
+
+    monkeypatch.setattr(purge, "withdraw_listens", withdraw_together)
+    errors = []
+
+    def run():
+        session = Session()
+        try:
+            while purge.purge_batch(session, 500):
+                pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    db = Session()
+    artist = counts(db, ArtistStats, ArtistStats.artist_id, catalog["artist"])
+    assert artist == (4, 2)
+    assert_no_drift(db)
+
+
+def test_reconcile_keeps_listens_recorded_meanwhile(Session, catalog, monkeypatch):
+    user_id, track_id = catalog["users"][0], catalog["tracks"][0]
+    expected_stats = stats._expected_stats
+
+    def listen():
+        session = Session()
+        try:
+            User.listen_by_id(session, user_id, track_id)
+        finally:
+            session.close()
+
+    def recompute_then_listen(db):
+        expected = expected_stats(db)
+        # Without the write lock this listen commits before the stats tables
+        # are replaced with the recompute, and is lost
+        thread = threading.Thread(target=listen)
+        thread.start()
+        thread.join(0.5)
+        threads.append(thread)
+        return expected
+
+    threads = []
+    monkeypatch.setattr(stats, "_expected_stats", recompute_then_listen)
+    db = Session()
+    # Drift makes reconcile rewrite the tables
+    db.get(TrackStats, track_id).total_plays = 0
+    db.commit()
+    reconcile(db)
+    threads[0].join()
+    monkeypatch.setattr(stats, "_expected_stats", expected_stats)
+
+    db.expire_all()
+    plays = db.scalar(
+        select(UserTrack.listen_count).where(
+            UserTrack.user_id == user_id, UserTrack.track_id == track_id
+        )
+    )
+    assert plays == 3
+    assert counts(db, TrackStats, TrackStats.track_id, track_id) == (5, 2)
+    assert_no_drift(db)
+
+
+def week_start(db, user_id):
+    return db.scalar(
+        select(UserPeriodStats.period_start).where(
+            UserPeriodStats.user_id == user_id, UserPeriodStats.period == "week"
+        )
+    )
+
+
+def week(db, user_id):
+    return db.execute(
+        select(UserPeriodStats.plays, UserPeriodStats.seconds).where(
+            UserPeriodStats.user_id == user_id, UserPeriodStats.period == "week"
+        )
+    ).one()
+
+
+def test_rebuilding_user_stats_keeps_maintained_periods(Session, catalog):
+    kept, missing = catalog["users"]
+    db = Session()
+    # Plays of a since purged track, which user_tracks no longer knows about
+    db.get(UserPeriodStats, (kept, "week", week_start(db, kept))).plays = 7
+    for model in USER_PERIOD_MODELS:
+        db.execute(delete(model).where(model.user_id == missing))
+    db.commit()
+
+    assert rebuild_user_stats(db) == 2
+    assert week(db, kept) == (7, 400)
+    assert week(db, missing) == (4, 400)
+
+    rebuild_user_stats(db, force=True)
+    assert week(db, kept) == (4, 400)
+
+
+def test_rebuilding_user_stats_keeps_listens_recorded_meanwhile(
+    Session, catalog, monkeypatch
+):
+    user_id, track_id = catalog["users"][0], catalog["tracks"][0]
+    period_rows = stats._period_rows
+    threads = []
+
+    def listen():
+        session = Session()
+        try:
+            User.listen_by_id(session, user_id, track_id)
+        finally:
+            session.close()
+
+    def recompute_then_listen(rows, key=None):
+        if not threads:
+            # Without the write lock this listen commits before the period
+            # rows are replaced with the recompute, and is lost
+            thread = threading.Thread(target=listen)
+            thread.start()
+            thread.join(0.5)
+            threads.append(thread)
+        return period_rows(rows, key)
+
+    monkeypatch.setattr(stats, "_period_rows", recompute_then_listen)
+    db = Session()
+    rebuild_user_stats(db, force=True)
+    threads[0].join()
+
+    db.expire_all()
+    assert week(db, user_id) == (5, 500)
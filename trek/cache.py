@@ -0,0 +1,507 @@
+import asyncio
+import itertools
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, namedtuple
+from typing import Any, Callable, Iterable
+from urllib.parse import urlparse
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .settings import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend:
+    """Key/value cache with tag versioning and single-flight recomputation.
+
+    Every cached key is namespaced by the current version of its tags, so
+    ``invalidate(tag)`` only has to bump one counter to make every dependent
+    entry unreachable. When the backend is shared (Redis) the bump is seen by
+    every worker at once.
+    """
+
+    lock_timeout = 10  # seconds a recomputing worker may hold a key
+    lock_poll = 0.05
+
+    def get(self, key: str) -> Any | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    def get_many(self, keys: list[str]) -> list[Any | None]:
+        return [self.get(key) for key in keys]
+
+    def acquire(self, key: str, ttl: int) -> str | None:
+        """Try to take a short-lived lock, returning its token on success."""
+        raise NotImplementedError
+
+    def release(self, key: str, token: str) -> None:
+        raise NotImplementedError
+
+    def versioned_key(self, key: str, tags: Iterable[str]) -> str:
+        tags = sorted(tags)
+        if not tags:
+            return key
+        versions = self.get_many([f"tag:{tag}" for tag in tags])
+        suffix = ":".join(
+            f"{tag}={version or 0}" for tag, version in zip(tags, versions)
+        )
+        return f"{key}|{suffix}"
+
+    def tag_version(self, tag: str) -> int:
+        return self.get(f"tag:{tag}") or 0
+
+    def invalidate(self, *tags: str) -> None:
+        """Drop every entry cached under any of the given tags.
+
+        Called after writes have committed, so a cache outage is logged rather
+        than raised; entries then expire by TTL.
+        """
+        for tag in tags:
+            try:
+                self.incr(f"tag:{tag}")
+            except Exception:
+                logger.error("Could not invalidate cache tag %s", tag, exc_info=True)
+
+    def _quietly(self, method: Callable, *args) -> Any:
+        try:
+            return method(*args)
+        except Exception:
+            logger.warning("Cache %s failed", method.__name__, exc_info=True)
+            return None
+
+    def _get_or_set_steps(self, key, compute, ttl, tags):
+        """Generator behind ``get_or_set``: yields the seconds to wait before
+        polling again and returns the value.
+
+        A failing backend is treated as a miss, so ``compute()`` still answers.
+        """
+        ttl = ttl or settings.CACHE["DEFAULT_TTL"]
+        try:
+            key = self.versioned_key(key, tags)
+            value = self.get(key)
+        except Exception:
+            logger.warning("Cache read of %s failed", key, exc_info=True)
+            return compute()
+        if value is not None:
+            return value
+
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                token = self.acquire(f"lock:{key}", self.lock_timeout)
+            except Exception:
+                logger.warning("Cache lock on %s failed", key, exc_info=True)
+                return compute()
+            if token:
+                try:
+                    value = compute()
+                    self._quietly(self.set, key, value, ttl)
+                    return value
+                finally:
+                    self._quietly(self.release, f"lock:{key}", token)
+
+            # Someone else is recomputing, wait for their result
+            yield self.lock_poll
+            value = self._quietly(self.get, key)
+            if value is not None:
+                return value
+            if time.monotonic() >= deadline:
+                return compute()
+
+    def get_or_set(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: int | None = None,
+        tags: Iterable[str] = (),
+    ) -> Any:
+        """Return the cached value, computing it at most once across workers.
+
+        ``compute`` must return a JSON-serialisable value. Use ``aget_or_set``
+        from async code, this one sleeps while waiting for another worker.
+        """
+        steps = self._get_or_set_steps(key, compute, ttl, tags)
+        try:
+            while True:
+                time.sleep(next(steps))
+        except StopIteration as done:
+            return done.value
+
+    async def aget_or_set(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: int | None = None,
+        tags: Iterable[str] = (),
+    ) -> Any:
+        """``get_or_set`` that waits without blocking the event loop."""
+        steps = self._get_or_set_steps(key, compute, ttl, tags)
+        try:
+            while True:
+                await asyncio.sleep(next(steps))
+        except StopIteration as done:
+            return done.value
+
+
+class LocalCache(CacheBackend):
+    """In-process LRU cache with per-entry TTL. Not shared between workers."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        # key -> (expires_at, value)
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        # Counters (tag versions) are kept apart so they are never evicted
+        self.counters: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self.lock:
+            if key in self.counters:
+                return self.counters[key]
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+            self.counters.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def acquire(self, key: str, ttl: int) -> str | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return None
+            token = uuid.uuid4().hex
+            self.entries[key] = (time.monotonic() + ttl, token)
+            return token
+
+    def release(self, key: str, token: str) -> None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] == token:
+                del self.entries[key]
+
+
+class RedisCache(CacheBackend):
+    """Cache shared by all workers through any server speaking RESP (Redis)."""
+
+    # Delete the lock only if we still own it
+    RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(
+        self,
+        url: str,
+        prefix: str = "trek:",
+        timeout: float = 1.0,
+        cooldown: float = 5.0,
+    ):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        # After a failed connect, calls fail fast for this many seconds instead
+        # of each waiting out the timeout while the server is down
+        self.cooldown = cooldown
+        self.down_until = 0.0
+        self.sock: socket.socket | None = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if time.monotonic() < self.down_until:
+            raise ConnectionError("Cache server unavailable")
+        try:
+            self.sock = socket.create_connection((self.host, self.port), self.timeout)
+        except OSError:
+            self.down_until = time.monotonic() + self.cooldown
+            raise
+        self.reader = self.sock.makefile("rb")
+        if self.password:
+            self.send("AUTH", self.password)
+        if self.db:
+            self.send("SELECT", self.db)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.reader = None
+
+    def send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        return self.read_reply()
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length == -1:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise RuntimeError(f"Unexpected reply from cache server: {line!r}")
+
+    def command(self, *args):
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    return self.send(*args)
+                except (OSError, ConnectionError):
+                    self.close()
+                    if attempt or time.monotonic() < self.down_until:
+                        raise
+
+    def get(self, key: str) -> Any | None:
+        data = self.command("GET", self.prefix + key)
+        return None if data is None else json.loads(data)
+
+    def get_many(self, keys: list[str]) -> list[Any | None]:
+        if not keys:
+            return []
+        values = self.command("MGET", *[self.prefix + key for key in keys])
+        return [None if data is None else json.loads(data) for data in values]
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self.command("SET", self.prefix + key, json.dumps(value), "EX", ttl)
+
+    def delete(self, key: str) -> None:
+        self.command("DEL", self.prefix + key)
+
+    def incr(self, key: str) -> int:
+        return self.command("INCR", self.prefix + key)
+
+    def acquire(self, key: str, ttl: int) -> str | None:
+        token = uuid.uuid4().hex
+        # Stored JSON-encoded so get() on a lock key stays well-formed
+        ok = self.command("SET", self.prefix + key, json.dumps(token), "NX", "EX", ttl)
+        return token if ok == "OK" else None
+
+    def release(self, key: str, token: str) -> None:
+        self.command(
+            "EVAL", self.RELEASE_SCRIPT, 1, self.prefix + key, json.dumps(token)
+        )
+
+
+def get_cache_backend() -> CacheBackend:
+    if settings.CACHE["BACKEND"] == "redis":
+        return RedisCache(settings.CACHE["REDIS_URL"])
+    return LocalCache(settings.CACHE["MAX_ENTRIES"])
+
+
+cache = get_cache_backend()
+
+
+class EntityCache:
+    """Read-through cache of immutable row snapshots, local to the process.
+
+    Entries are keyed by primary key; lookups by a model's other
+    ``cache_fields`` (unique columns) go through an index to the primary key.
+    Each entry remembers the version of its ``<table>:<id>`` tag in the shared
+    cache when it was loaded and is only served while that version is current.
+    The version is bumped after every commit that changed the row (see the
+    session hooks below), so invalidation reaches every worker sharing the
+    cache backend. Entries also expire ``ttl`` seconds after they were loaded,
+    which bounds staleness when the backend isn't shared (each process of the
+    local backend keeps its own versions and never sees the others' bumps).
+    """
+
+    def __init__(self, backend: CacheBackend, max_entries: int, ttl: float):
+        self.backend = backend
+        self.max_entries = max_entries  # 0 disables caching
+        self.ttl = ttl
+        # (table, id) -> (version, expires, snapshot),
+        # ("index", table, field, value) -> id
+        self.entries: OrderedDict[tuple, Any] = OrderedDict()
+        self.snapshot_types: dict[type, type] = {}
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+        self.lock = threading.Lock()
+
+    def snapshot(self, instance) -> tuple:
+        """Copy the column values of a model instance into a named tuple."""
+        model = type(instance)
+        snapshot_type = self.snapshot_types.get(model)
+        if snapshot_type is None:
+            snapshot_type = namedtuple(
+                f"{model.__name__}Snapshot",
+                [attr.key for attr in inspect(model).column_attrs],
+            )
+            self.snapshot_types[model] = snapshot_type
+        return snapshot_type._make(
+            getattr(instance, name) for name in snapshot_type._fields
+        )
+
+    def load(self, db: Session, model, **kwargs) -> tuple | None:
+        instance = model.get(db, **kwargs)
+        return None if instance is None else self.snapshot(instance)
+
+    def lookup(self, key: tuple) -> Any | None:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def store(self, key: tuple, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, db: Session, model, **kwargs) -> tuple | None:
+        """Snapshot of the active row matching one cached field, or None."""
+        ((field, value),) = kwargs.items()
+        if field not in model.cache_fields:
+            raise ValueError(f"{model.__name__}.{field} is not a cached field")
+        if not self.max_entries:
+            return self.load(db, model, **kwargs)
+
+        table = model.__tablename__
+        pk = value if field == "id" else self.lookup(("index", table, field, value))
+        if pk is None:
+            self.misses[table] += 1
+        else:
+            try:
+                version = self.backend.tag_version(f"{table}:{pk}")
+            except Exception:
+                # Without a version nothing can be validated, read through
+                logger.warning("Entity cache version read failed", exc_info=True)
+                return self.load(db, model, **kwargs)
+            entry = self.lookup((table, pk))
+            now = time.monotonic()
+            if (
+                entry is not None
+                and entry[0] == version
+                and entry[1] > now
+                and getattr(entry[2], field) == value
+            ):
+                self.hits[table] += 1
+                return entry[2]
+
+            self.misses[table] += 1
+            # The version was read before the row, so a concurrent change can
+            # only make this entry look older than it is, never newer
+            snapshot = self.load(db, model, id=pk)
+            if snapshot is not None:
+                self.store((table, pk), (version, now + self.ttl, snapshot))
+            if field == "id" or (
+                snapshot is not None and getattr(snapshot, field) == value
+            ):
+                return snapshot
+            # The indexed row no longer holds this value, look it up afresh
+
+        snapshot = self.load(db, model, **kwargs)
+        if snapshot is not None:
+            # Only the id is kept: without a version read up front the row
+            # can't be cached yet, the next lookup loads it by id
+            self.store(("index", table, field, value), snapshot.id)
+        return snapshot
+
+    def mark_stale(self, db: Session, model, ids: Iterable[int]) -> None:
+        """Invalidate rows changed by bulk statements once ``db`` commits."""
+        db.info.setdefault("stale_entities", set()).update(
+            f"{model.__tablename__}:{id}" for id in ids
+        )
+
+    def stats(self) -> dict:
+        tables = {}
+        for table in sorted(self.hits.keys() | self.misses.keys()):
+            hits, misses = self.hits[table], self.misses[table]
+            tables[table] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses),
+            }
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "tables": tables,
+        }
+
+
+entity_cache = EntityCache(
+    cache, settings.CACHE["ENTITY_MAX_ENTRIES"], settings.CACHE["ENTITY_TTL"]
+)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_stale_entities(session: Session, flush_context):
+    stale = session.info.setdefault("stale_entities", set())
+    for instance in itertools.chain(session.dirty, session.deleted):
+        if getattr(instance, "cache_fields", None):
+            stale.add(f"{instance.__tablename__}:{instance.id}")
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_stale_entities(session: Session):
+    # Bumped only after the commit, so no reader can cache the old row under
+    # the new version
+    stale = session.info.pop("stale_entities", None)
+    if stale:
+        cache.invalidate(*stale)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stale_entities(session: Session):
+    session.info.pop("stale_entities", None)
@@ -0,0 +1,185 @@
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .settings import get_settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+settings = get_settings()
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        flush_mode = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        return self.compressor.compress(data) + self.compressor.flush(flush_mode)
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        output = self.compressor.process(data)
+        return output + (self.compressor.finish() if final else self.compressor.flush())
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        flush_mode = (
+            zstandard.COMPRESSOBJ_FLUSH_FINISH
+            if final
+            else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+        return self.compressor.compress(data) + self.compressor.flush(flush_mode)
+
+
+def get_encoders() -> dict:
+    """Available encoders by content-coding, in server preference order."""
+    levels = settings.COMPRESSION
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = lambda: ZstdEncoder(levels["ZSTD_LEVEL"])
+    if brotli is not None:
+        encoders["br"] = lambda: BrotliEncoder(levels["BROTLI_QUALITY"])
+    encoders["gzip"] = lambda: GzipEncoder(levels["GZIP_LEVEL"])
+    return encoders
+
+
+ENCODERS = get_encoders()
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """Pick the best available content-coding allowed by ``Accept-Encoding``."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in ENCODERS:
+        quality = weights.get(coding, weights.get("*", 0.0))
+        # Ties go to the earlier (preferred) encoder
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """Compress responses according to ``Accept-Encoding``.
+
+    Complete bodies smaller than ``minimum_size`` are sent as-is. Streaming
+    bodies are compressed and flushed chunk by chunk, so clients receive data
+    as soon as the application produces it.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int | None = None):
+        self.app = app
+        self.minimum_size = (
+            minimum_size
+            if minimum_size is not None
+            else settings.COMPRESSION["MINIMUM_SIZE"]
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message: Message | None = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Hold the headers until the first body chunk tells us its size
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start_message["headers"])
+            content_type = headers.get("content-type", "")
+
+            if "content-encoding" in headers or not content_type.startswith(
+                COMPRESSIBLE_TYPES
+            ):
+                self.passthrough = True
+            else:
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    self.passthrough = True
+
+            if self.passthrough:
+                await self._send(start_message)
+                await self._send(message)
+                return
+
+            self.encoder = ENCODERS[self.encoding]()
+            data = self.encoder.compress(body, final=not more_body)
+            headers["Content-Encoding"] = self.encoding
+            if more_body:
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(data))
+            await self._send(start_message)
+        else:
+            data = self.encoder.compress(body, final=not more_body)
+
+        await self._send(
+            {"type": "http.response.body", "body": data, "more_body": more_body}
+        )
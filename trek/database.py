@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from .settings import get_settings
@@ -16,3 +16,26 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+
+def get_insert(db: Session):
+    """Return the dialect's INSERT construct, which supports ON CONFLICT upserts."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def lock_tables(db: Session, *tables):
+    """Block other writers to ``tables`` until the current transaction ends.
+
+    SQLite can only lock the whole database, with ``BEGIN IMMEDIATE``, so
+    there this must run before anything else in the transaction. List tables
+    in the order concurrent writers update them to avoid deadlocks.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("BEGIN IMMEDIATE"))
+    else:
+        names = ", ".join(table.name for table in tables)
+        db.execute(text(f"LOCK TABLE {names} IN SHARE ROW EXCLUSIVE MODE"))
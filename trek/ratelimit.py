@@ -0,0 +1,87 @@
+import math
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+
+from .settings import get_settings
+
+settings = get_settings()
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by client, refilled lazily and evicted in LRU order."""
+
+    def __init__(self, rate: float, capacity: int, max_buckets: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_buckets = max_buckets
+        # key -> (tokens, last refill timestamp)
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str) -> float:
+        """Consume one token for the key.
+
+        Returns 0 if the request is allowed, otherwise the number of seconds
+        until a token becomes available.
+        """
+        now = time.monotonic()
+        tokens, last = self.buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last) * self.rate)
+
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            retry_after = (1 - tokens) / self.rate
+
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_buckets:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+
+def _check(limiter: TokenBucketLimiter, key: str):
+    retry_after = limiter.take(key)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def rate_limit(name: str, key_field: str | None = None):
+    """Build a dependency enforcing the ``settings.RATE_LIMITS[name]`` budget.
+
+    Clients are always limited by IP address. With ``key_field``, the value of
+    that JSON body field gets its own ``RATE_LIMITS[name]`` bucket on top, and
+    the IP bucket uses the wider ``RATE_LIMITS[f"{name}_ip"]`` budget (several
+    users may share an address). The body field is client-chosen, so the IP
+    bucket is checked first: a client rotating values is stopped there before
+    its fresh keys can evict other clients' buckets.
+    """
+    budget = settings.RATE_LIMITS[f"{name}_ip" if key_field else name]
+    ip_limiter = TokenBucketLimiter(*budget, settings.RATE_LIMIT_MAX_BUCKETS)
+    key_limiter = None
+    if key_field:
+        rate, capacity = settings.RATE_LIMITS[name]
+        key_limiter = TokenBucketLimiter(
+            rate, capacity, settings.RATE_LIMIT_MAX_BUCKETS
+        )
+
+    async def dependency(request: Request):
+        _check(ip_limiter, request.client.host if request.client else "unknown")
+        if key_limiter is None:
+            return
+
+        try:
+            body = await request.json()
+        except ValueError:
+            return
+        if isinstance(body, dict) and body.get(key_field) is not None:
+            _check(key_limiter, str(body[key_field]))
+
+    dependency.limiter = key_limiter or ip_limiter
+    dependency.ip_limiter = ip_limiter
+    return dependency
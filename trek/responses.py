@@ -0,0 +1,52 @@
+import json
+from itertools import islice
+from typing import Callable, Iterable
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query
+
+from .database import SessionLocal
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(
+    build_query: Callable[..., Query],
+    serialize: Callable | None = None,
+    batch_size: int = 500,
+    serialize_batch: Callable | None = None,
+) -> StreamingResponse:
+    """Stream query results as newline-delimited JSON, one object per row.
+
+    The query runs on its own session, since request-scoped sessions are
+    closed before a streaming body is sent. Rows are fetched ``batch_size``
+    at a time, so the full result set is never held in memory, and each batch
+    is sent as one chunk so compression doesn't flush after every row.
+
+    ``serialize_batch(db, rows)`` can replace ``serialize`` to turn a whole
+    batch into objects at once, e.g. to load related rows in one query.
+    """
+
+    if serialize_batch is None:
+
+        def serialize_batch(db, rows):
+            return map(serialize, rows)
+
+    def generate() -> Iterable[bytes]:
+        db = SessionLocal()
+        try:
+            rows = iter(build_query(db).yield_per(batch_size))
+            while batch := list(islice(rows, batch_size)):
+                yield b"".join(
+                    json.dumps(item).encode() + b"\n"
+                    for item in serialize_batch(db, batch)
+                )
+        finally:
+            db.close()
+
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
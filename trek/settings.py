@@ -17,6 +17,63 @@ class Settings:
         self.SECRET_KEY = os.getenv("SECRET_KEY")
         self.ALGORITHM = os.getenv("ALGORITHM")
         self.DB = {"DATABASE_URL": "sqlite:///./db.sqlite3"}
+        self.MEDIA_ROOT = BASE_DIR / "media"
+        # route name: (tokens refilled per second, bucket capacity)
+        self.RATE_LIMITS = {
+            "listen": (5, 20),  # per user_id
+            "listen_ip": (20, 100),  # per client address, across all user_ids
+            "sign_up": (0.1, 5),
+            "check_password": (0.5, 10),
+        }
+        self.RATE_LIMIT_MAX_BUCKETS = 10000  # idle buckets are evicted past this
+        self.CACHE = {
+            "BACKEND": os.getenv("CACHE_BACKEND", "local"),  # local | redis
+            "REDIS_URL": os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            "MAX_ENTRIES": 1024,  # local backend only
+            "DEFAULT_TTL": 60,  # seconds
+            "ENTITY_MAX_ENTRIES": 10000,  # row snapshots per process, 0 disables
+            "ENTITY_TTL": 60,  # seconds a row snapshot is served without reloading
+        }
+        self.PURGE = {
+            "BATCH_SIZE": 500,  # rows deleted per transaction
+            "PAUSE": 0.05,  # seconds between batches
+        }
+        self.COMPRESSION = {
+            "MINIMUM_SIZE": 500,  # bytes; smaller complete bodies are sent as-is
+            "GZIP_LEVEL": 6,
+            "BROTLI_QUALITY": 4,  # used when the brotli package is installed
+            "ZSTD_LEVEL": 3,  # used when the zstandard package is installed
+        }
+        self.STORAGE = {
+            "BLOB_ROOT": self.MEDIA_ROOT / "blobs",  # sharded as ab/cd/<sha256>
+            "CHUNK_SIZE": 1024 * 1024,  # bytes read per upload chunk
+            "GC_GRACE": 3600,  # seconds an unreferenced blob is kept
+        }
+        self.WAVEFORM = {
+            # samples per (min, max) peak pair at each zoom level
+            "LEVELS": (256, 1024, 4096, 16384),
+        }
+        self.RADIO = {
+            # relative probability of following each relation on a walk step
+            "WEIGHTS": {"artist": 0.35, "album": 0.15, "listener": 0.5},
+            "RESTART": 0.15,  # chance of jumping back to the seed each step
+            "STEPS_PER_TRACK": 20,  # walk budget before topping up randomly
+            "REFRESH_INTERVAL": 60,  # seconds
+            "REFRESH_OVERLAP": 30,  # seconds of changes re-read on every refresh
+            "MAX_LIMIT": 100,
+        }
+        self.JOBS = {
+            "MODULES": ["core.tasks"],  # modules registering job handlers
+            "RUN_IN_APP": os.getenv("JOBS_RUN_IN_APP", "1") == "1",
+            "CONCURRENCY": 4,  # asyncio workers per process
+            "PROCESSES": 2,  # process pool size for CPU-bound jobs
+            "POLL_INTERVAL": 1.0,  # seconds
+            "MAX_ATTEMPTS": 5,
+            "BACKOFF": 2,  # seconds, doubled on every retry
+            "LOCK_TIMEOUT": 300,  # seconds without a heartbeat before a job is dead
+            "HEARTBEAT": 60,  # seconds between heartbeats of a running job
+            "RETENTION": 7 * 24 * 3600,  # seconds finished jobs are kept
+        }
 
 
 @lru_cache()
@@ -8,8 +8,10 @@ from sqlalchemy import (
     Boolean,
     DateTime,
     ForeignKey,
+    Index,
     Table,
     func,
+    true,
 )
 from sqlalchemy.orm import Session, relationship
 
@@ -24,7 +26,7 @@ class UserTrack(BaseModel):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    track_id = Column(Integer, ForeignKey("tracks.id"), nullable=False)
+    track_id = Column(Integer, ForeignKey("tracks.id"), nullable=False, index=True)
     listen_count = Column(Integer, default=0)  # Counts listens for each track
     last_listened = Column(
         DateTime, default=datetime.now
@@ -41,14 +43,22 @@ class UserTrack(BaseModel):
         db.commit()
 
 
+# Every listen looks up the user's row for the track
+Index("ix_user_tracks_user_id_track_id", UserTrack.user_id, UserTrack.track_id)
+# The radio graph re-reads listens changed since its last refresh
+Index("ix_user_tracks_updated_at", UserTrack.updated_at)
+
+
 class User(BaseModel):
     __tablename__ = "users"
+    cache_fields = ("id", "username", "phone_number")
+    unique_when_active = ("username", "phone_number")
 
     id = Column(
         Integer, primary_key=True, index=True, default=get_number_id, unique=True
     )
-    username = Column(String(50), unique=True, nullable=False)
-    phone_number = Column(String(15), unique=True, nullable=True)
+    username = Column(String(50), nullable=False)
+    phone_number = Column(String(15), nullable=True)
     password = Column(String(255), nullable=False)
     tracks = relationship("UserTrack", back_populates="user")
 
@@ -72,20 +82,30 @@ class User(BaseModel):
 
     def listen_to_track(self, db: Session, track_id: int):
         """Record a listen event for the specified track."""
+        self.listen_by_id(db, self.id, track_id)
+
+    @staticmethod
+    def listen_by_id(db: Session, user_id: int, track_id: int):
+        """``listen_to_track`` for a user known only by id, e.g. a cached snapshot."""
+        from core.stats import record_listen
+
         # Check if there's an existing UserTrack entry for this user and track
         user_track = (
             db.query(UserTrack)
-            .filter(UserTrack.user_id == self.id, UserTrack.track_id == track_id)
+            .filter(UserTrack.user_id == user_id, UserTrack.track_id == track_id)
             .first()
         )
 
+        # Stats are updated in the same transaction as the listen itself
+        record_listen(db, user_id, track_id, first_listen=user_track is None)
+
         if user_track:
             # If exists, increment listen count and update timestamp
             user_track.listen(db)
         else:
             # If not exists, create a new UserTrack entry
             new_user_track = UserTrack(
-                user_id=self.id,
+                user_id=user_id,
                 track_id=track_id,
                 listen_count=1,
                 last_listened=datetime.utcnow(),
@@ -108,7 +128,7 @@ class User(BaseModel):
         recommendations = (
             db.query(Track)
             .filter(
-                ~Track.id.in_(user_tracks)
+                ~Track.id.in_(user_tracks), Track.is_active == true()
             )  # Exclude tracks the user has already listened to
             .order_by(func.random())  # Randomize to simulate suggestions
             .limit(limit)
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from pydantic import BaseModel
 
 
@@ -20,3 +20,25 @@ class UserResponseSchema(BaseModel):
     is_active: bool
     created_at: datetime
     updated_at: datetime
+
+
+class TopEntrySchema(BaseModel):
+    id: int
+    name: str
+    plays: int
+    seconds: int
+
+
+class PeriodStatsSchema(BaseModel):
+    period_start: date
+    plays: int
+    seconds: int
+    top_artists: list[TopEntrySchema]
+    top_albums: list[TopEntrySchema]
+
+
+class UserStatsResponseSchema(BaseModel):
+    user_id: int
+    week: PeriodStatsSchema
+    month: PeriodStatsSchema
+    year: PeriodStatsSchema
@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from .models import User
-from .schemas import UserCreateSchema, UserCheckPasswordSchema, UserResponseSchema
+from .schemas import (
+    UserCreateSchema,
+    UserCheckPasswordSchema,
+    UserResponseSchema,
+    UserStatsResponseSchema,
+)
 from trek.database import get_db
+from trek.ratelimit import rate_limit
+from trek.responses import ndjson_response, wants_ndjson
+from core.stats import get_user_stats
 
 router = APIRouter()
 
 
-@router.post("/sign-up/")
+@router.post("/sign-up/", dependencies=[Depends(rate_limit("sign_up"))])
 async def register(user_data: UserCreateSchema, db: Session = Depends(get_db)):
     existing_user = User.get(db, username=user_data.username)
     if existing_user:
@@ -15,11 +24,22 @@ async def register(user_data: UserCreateSchema, db: Session = Depends(get_db)):
 
     new_user = User(username=user_data.username, phone_number=user_data.phone_number)
     new_user.set_password(user_data.password)
-    new_user.save(db)
+    try:
+        new_user.save(db)
+    except IntegrityError:
+        # Phone number in use, or a concurrent sign-up took the username
+        raise HTTPException(
+            status_code=400, detail="Username or phone number already taken"
+        )
     return {"message": "User created successfully", "user_id": new_user.id}
 
 
-@router.post("/check_password/", response_model=UserResponseSchema, status_code=200)
+@router.post(
+    "/check_password/",
+    response_model=UserResponseSchema,
+    status_code=200,
+    dependencies=[Depends(rate_limit("check_password"))],
+)
 async def check_password(
     user_data: UserCheckPasswordSchema, db: Session = Depends(get_db)
 ) -> User:
@@ -36,14 +56,22 @@ async def check_password(
 
 
 @router.get("/", response_model=list[UserResponseSchema])
-async def get_users(db: Session = Depends(get_db)) -> [User]:
+async def get_users(request: Request, db: Session = Depends(get_db)) -> [User]:
+    if wants_ndjson(request):
+        return ndjson_response(
+            User.active,
+            lambda user: UserResponseSchema.model_validate(
+                user, from_attributes=True
+            ).model_dump(mode="json"),
+        )
+
     users = User.all(db)
     return users
 
 
 @router.get("/@{username}", response_model=UserResponseSchema)
 async def get_user_by_username(username: str, db: Session = Depends(get_db)) -> User:
-    user = User.get(db, username=username)
+    user = User.get_cached(db, username=username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -52,7 +80,7 @@ async def get_user_by_username(username: str, db: Session = Depends(get_db)) ->
 
 @router.get("/{id}")
 async def get_user_by_id(id: int, db: Session = Depends(get_db)):
-    user = User.get(db, id=id)
+    user = User.get_cached(db, id=id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -61,3 +89,14 @@ async def get_user_by_id(id: int, db: Session = Depends(get_db)):
         "username": user.username,
         "phone_number": user.phone_number,
     }
+
+
+@router.get("/{id}/stats/", response_model=UserStatsResponseSchema)
+async def get_user_stats_by_id(
+    id: int, limit: int = Query(default=5, ge=1, le=50), db: Session = Depends(get_db)
+):
+    user = User.get_cached(db, id=id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return {"user_id": id, **get_user_stats(db, id, limit)}